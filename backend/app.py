@@ -8,13 +8,30 @@
 # - os: built-in module to access environment variables and paths
 # - dotenv: loads local .env file so secrets are available at runtime
 # - isodate: parses ISO 8601 date/time formats (used by YouTube API)
+# - cache, singleflight, quota, prefetch, upstream, metrics, logs, responses, assets: our own helper files
+#   in this backend folder (caching, request coalescing, quota bookkeeping, next-page prefetching, the pooled
+#   HTTP client, timing/metrics, logging, response compression/ETags and fingerprinted frontend files)
 # -------------------------------------------------------------
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, g, abort
 import requests
 import os
 from dotenv import load_dotenv
 import isodate
+import json
+import base64
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from cache import TieredCache
+from singleflight import SingleFlight
+from prefetch import Prefetcher
+from quota import QuotaAccountant, QuotaExhausted, SEARCH_COST, VIDEOS_COST, PRIORITIES, PACIFIC_MIDNIGHT_OFFSET
+import upstream
+import metrics
+import logs
+import responses
+from assets import AssetManifest
+import time
 
 # this calls my .env file, loading any environment variables found there ie. API keys
 load_dotenv()
@@ -29,9 +46,116 @@ app = Flask(__name__, static_folder="../frontend", static_url_path="/")
 # If you can't find it, use YOUR_API_KEY as a placeholder.
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY", "YOUR_API_KEY")
 
+# if you've got more than one API key, list them all in YOUTUBE_API_KEYS separated by commas
+# and we'll spread the calls across them. otherwise we just use the one key above.
+YOUTUBE_API_KEYS = [key.strip() for key in os.getenv("YOUTUBE_API_KEYS", "").split(",") if key.strip()] or [YOUTUBE_API_KEY]
+
+# this keeps track of how much of YouTube's daily quota we've spent (see quota.py).
+# QUOTA_UNITS_PER_KEY is how many units each key gets per QUOTA_WINDOW_SECONDS in this worker,
+# and QUOTA_BACKGROUND_RESERVE is the share of it that only interactive searches are allowed to use.
+# QUOTA_BURST_UNITS is how much of that can be spent in one quick rush (the rest trickles back in over the window),
+# and QUOTA_WINDOW_OFFSET_SECONDS is when the window starts, in seconds after midnight UTC (YouTube resets at midnight Pacific).
+quota = QuotaAccountant(
+    YOUTUBE_API_KEYS,
+    units_per_key=int(os.getenv("QUOTA_UNITS_PER_KEY", 10000)),
+    window_seconds=int(os.getenv("QUOTA_WINDOW_SECONDS", 86400)),
+    background_reserve=float(os.getenv("QUOTA_BACKGROUND_RESERVE", 0.2)),
+    burst_units=int(os.getenv("QUOTA_BURST_UNITS")) if os.getenv("QUOTA_BURST_UNITS") else None,
+    window_offset_seconds=int(os.getenv("QUOTA_WINDOW_OFFSET_SECONDS", PACIFIC_MIDNIGHT_OFFSET)),
+)
+
 # these are the YouTube API endpoints we'll be using. any api call will go to these urls
-YOUTUBE_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
-YOUTUBE_VIDEOS_URL = "https://www.googleapis.com/youtube/v3/videos"
+# you can point them somewhere else with environment variables, e.g. at fake_youtube.py for load testing
+YOUTUBE_SEARCH_URL = os.getenv("YOUTUBE_SEARCH_URL", "https://www.googleapis.com/youtube/v3/search")
+YOUTUBE_VIDEOS_URL = os.getenv("YOUTUBE_VIDEOS_URL", "https://www.googleapis.com/youtube/v3/videos")
+
+# the two kinds of YouTube call we make, with where they go and how much quota each one costs
+YOUTUBE_ENDPOINTS = {
+    "search": (YOUTUBE_SEARCH_URL, SEARCH_COST),
+    "videos": (YOUTUBE_VIDEOS_URL, VIDEOS_COST)
+}
+
+# YouTube sends back a lot more than we use (full descriptions, every thumbnail size, translations...).
+# these "fields" masks ask it for only the bits build_video_result and search_video_ids actually read,
+# which means fewer bytes over the network and less JSON to parse.
+SEARCH_FIELDS = "nextPageToken,items(id/videoId)"
+VIDEOS_FIELDS = (
+    "items(id,snippet(title,channelTitle,publishedAt,thumbnails/medium/url),"
+    "contentDetails/duration,statistics/viewCount)"
+)
+
+# how long (in seconds) the browser may reuse a /api/search response without checking back with us.
+# after that it asks again with the ETag, and gets a tiny 304 if nothing changed (see responses.py).
+SEARCH_BROWSER_MAX_AGE = int(os.getenv("SEARCH_BROWSER_MAX_AGE", 60))
+
+# our logger (see logs.py). it writes JSON lines from a background thread instead of print()-ing
+log = logs.get_logger()
+
+# these are the caches that sit in front of the YouTube API (see cache.py for how they work).
+# search_cache remembers whole result pages for a (query, maxResults, order, pageToken) combo.
+# video_cache remembers the details of each individual video, so if two different searches
+# return the same video we only have to ask YouTube about it once.
+# CACHE_DB_PATH is optional. If you set it, the caches also live in a SQLite file on disk
+# that every gunicorn worker shares. If you don't, each worker just keeps its own in-memory cache.
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH") or None
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+# CACHE_STALE_TTL is how long we hang on to expired entries, so we have something to show
+# (marked "stale") when we've run out of YouTube quota.
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", 86400))
+search_cache = TieredCache(
+    "search",
+    max_entries=CACHE_MAX_ENTRIES,
+    ttl=int(os.getenv("SEARCH_CACHE_TTL", 600)),
+    stale_ttl=CACHE_STALE_TTL,
+    db_path=CACHE_DB_PATH,
+)
+video_cache = TieredCache(
+    "videos",
+    max_entries=CACHE_MAX_ENTRIES * 12,
+    ttl=int(os.getenv("VIDEO_CACHE_TTL", 3600)),
+    stale_ttl=CACHE_STALE_TTL,
+    db_path=CACHE_DB_PATH,
+)
+
+# these stop identical YouTube calls from running at the same time (see singleflight.py).
+# SINGLEFLIGHT_LOCK_DIR is optional. If you set it to a folder, gunicorn workers also coordinate
+# with each other through lock files in there, which pairs well with CACHE_DB_PATH.
+SINGLEFLIGHT_LOCK_DIR = os.getenv("SINGLEFLIGHT_LOCK_DIR") or None
+search_flight = SingleFlight("search", lock_dir=SINGLEFLIGHT_LOCK_DIR)
+video_flight = SingleFlight("videos")
+
+# a small, shared pool of threads for running several YouTube calls at the same time
+# (e.g. the searches in a batch request, or videos.list calls for more than 50 IDs).
+# UPSTREAM_WORKERS caps how many run at once in each gunicorn worker, so one big batch can't flood YouTube.
+# one rule: code running inside this pool must never wait on more work from this same pool, or it could deadlock.
+upstream_pool = ThreadPoolExecutor(max_workers=int(os.getenv("UPSTREAM_WORKERS", 8)))
+
+
+# runs run_and_catch(fn, *args) on the pool, taking the current request's context along with it.
+# without that, the pool thread can't see the request's timer and its upstream calls go missing
+# from the Server-Timing header. (each call needs its own copy: one copy can't be used by two threads at once)
+def submit_upstream(fn, *args):
+    return upstream_pool.submit(contextvars.copy_context().run, run_and_catch, fn, *args)
+
+# when a search asks for it (prefetch=1), we fetch the next page in the background so it's ready
+# by the time the user scrolls down (see prefetch.py). PREFETCH_DEPTH is how many pages ahead to go,
+# and the rest put limits on threads, prefetches running at once, memory and how long an unused page is kept.
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", 1))
+prefetcher = Prefetcher(
+    workers=int(os.getenv("PREFETCH_WORKERS", 2)),
+    max_in_flight=int(os.getenv("PREFETCH_MAX_IN_FLIGHT", 4)),
+    max_bytes=int(os.getenv("PREFETCH_MAX_BYTES", 8 * 1024 * 1024)),
+    ttl=int(os.getenv("PREFETCH_TTL", 300)),
+)
+
+# videos.list only accepts up to 50 IDs per call, and a batch can ask for more than that at once
+VIDEOS_PER_CALL = 50
+
+# how many queries one /api/search/batch request may contain
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 50))
+
+# search.list won't give more than 50 results per page, so that's the most a batch query can ask for
+SEARCH_MAX_RESULTS = 50
 
 # Here's a small dictionary to translate between how my javascript frontend names the different kinds of sorting,
 # and how the YouTube API expects them to be named.
@@ -41,6 +165,21 @@ ORDER_MAP = {
     "date": "date",
     "views": "viewCount"
 }
+
+# and here's how the duration filters map to seconds, as (shortest, longest) with both ends included.
+# None means "no limit". I copied YouTube's own definitions (short is under 4 minutes,
+# medium is 4 to 20 minutes, long is over 20), so we can also ask YouTube to pre-filter for us.
+DURATION_FILTERS = {
+    "short": (0, 239),
+    "medium": (240, 1200),
+    "long": (1201, None)
+}
+
+# when filtering, we ask YouTube for its biggest page (50 videos) since a search costs the same quota
+# no matter how many results come back. FILTER_PAGE_BUDGET caps how many pages one request may walk
+# through looking for matches, so a very picky filter can't burn through our whole quota.
+FILTER_PAGE_SIZE = 50
+FILTER_PAGE_BUDGET = int(os.getenv("FILTER_PAGE_BUDGET", 3))
 # Now I’m defining a helper function that converts YouTube’s
 # def = syntax for defining a function
 # weird duration format (like "PT15M3S") into total seconds.
@@ -53,138 +192,739 @@ def parse_iso_duration(iso_duration):
         return 0
 
 
+# this turns one item from YouTube's videos.list response into the small dict the frontend needs.
+# see backend/sample responses/sample api call 2.json for what the raw item looks like.
+def build_video_result(item):
+    snippet = item.get("snippet", {})
+    stats = item.get("statistics", {})
+    content = item.get("contentDetails", {})
+    return {
+        "videoId": item.get("id"),
+        "title": snippet.get("title"),
+        "channel": snippet.get("channelTitle"),
+        "views": int(stats.get("viewCount", 0)),
+        "published_at": snippet.get("publishedAt"),
+        "duration": content.get("duration"),
+        "durationSeconds": parse_iso_duration(content.get("duration")),
+        "thumbnail": snippet.get("thumbnails", {}).get("medium", {}).get("url")
+    }
+
+
+# if YouTube answers fine at the network level but puts an "error" in the JSON body,
+# we raise this so the endpoint can turn it into a 502, the same way it does for network errors.
+class YouTubeAPIError(Exception):
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+# every call to YouTube goes through here. it asks the quota bookkeeper which API key to use
+# (or raises QuotaExhausted if we can't afford the call), and if YouTube says that key is out of quota
+# anyway, it marks the key as used up and tries the next one.
+# endpoint is "search" or "videos" (see YOUTUBE_ENDPOINTS).
+# priority is "interactive" for someone waiting on a search, or "background" for work nobody is waiting on.
+# each call is timed as the "upstream_search" or "upstream_videos" stage, and its status code is counted for /metrics.
+def call_youtube(endpoint, params, priority="interactive"):
+    url, cost = YOUTUBE_ENDPOINTS[endpoint]
+    for _ in YOUTUBE_API_KEYS:
+        key = quota.acquire(cost, priority)
+        try:
+            with metrics.stage(f"upstream_{endpoint}"):
+                data = upstream.get_json(url, {**params, "key": key})
+            metrics.upstream_responses.inc(endpoint=endpoint, status=200)
+            return data
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else "error"
+            metrics.upstream_responses.inc(endpoint=endpoint, status=status)
+            if not is_quota_error(e):
+                raise
+            quota.mark_exhausted(key)
+        except requests.exceptions.RequestException:
+            metrics.upstream_responses.inc(endpoint=endpoint, status="network_error")
+            raise
+    raise QuotaExhausted(retry_after=quota.window_seconds)
+
+
+# YouTube says "out of quota" with a 403 and one of these reasons in the error body
+QUOTA_ERROR_REASONS = ("quotaExceeded", "dailyLimitExceeded")
+
+
+def is_quota_error(error):
+    response = error.response
+    if response is None or response.status_code != 403:
+        return False
+    return any(reason in response.text for reason in QUOTA_ERROR_REASONS)
+
+
+# this gets the details (title, views, duration...) for a list of video IDs.
+# we only ask YouTube about videos that aren't already sitting in the video cache,
+# and if another request in this worker is already fetching some of these IDs, we wait for it instead of asking twice.
+# it hands back a dict of videoId -> video details, or raises if any of the YouTube calls failed.
+def fetch_video_details(video_ids, priority="interactive"):
+    videos, errors = fetch_video_details_partial(video_ids, priority)
+    if errors:
+        raise next(iter(errors.values()))
+    return videos
+
+
+# same as fetch_video_details, but a failed videos.list call doesn't spoil the whole thing.
+# it hands back (videos, errors), where errors is a dict of videoId -> the exception for the IDs we couldn't get.
+# the batch endpoint uses this so one bad chunk only fails the queries that actually needed it.
+def fetch_video_details_partial(video_ids, priority="interactive"):
+    videos = video_cache.get_many(video_ids)
+    # dict.fromkeys drops duplicate IDs but keeps the order, like a Set in JS
+    missing_ids = list(dict.fromkeys(video_id for video_id in video_ids if video_id not in videos))
+    chunks = [missing_ids[i:i + VIDEOS_PER_CALL] for i in range(0, len(missing_ids), VIDEOS_PER_CALL)]
+
+    def fetch_chunk(chunk):
+        return video_flight.do_many(chunk, lambda ids: fetch_missing_videos(ids, priority))
+
+    # one chunk (the usual case) is fetched right here. more than one get fetched in parallel on the pool.
+    if len(chunks) == 1:
+        outcomes = [(chunks[0], run_and_catch(fetch_chunk, chunks[0]))]
+    else:
+        futures = [(chunk, submit_upstream(fetch_chunk, chunk)) for chunk in chunks]
+        outcomes = [(chunk, future.result()) for chunk, future in futures]
+
+    errors = {}
+    for chunk, (fetched, error) in outcomes:
+        if error is None:
+            videos.update(fetched)
+            continue
+        for video_id in chunk:
+            # out of quota? an older copy of the video's details beats no details at all
+            stale = video_cache.get_stale(video_id) if isinstance(error, QuotaExhausted) else None
+            if stale is not None:
+                videos[video_id] = stale
+            else:
+                errors[video_id] = error
+    return videos, errors
+
+
+# runs fn(*args) and hands back (result, None), or (None, error) if it raised one of the errors we expect from YouTube
+def run_and_catch(fn, *args):
+    try:
+        return fn(*args), None
+    except (requests.exceptions.RequestException, YouTubeAPIError, QuotaExhausted) as e:
+        return None, e
+
+
+# this is the actual videos.list call for IDs nobody has cached or is already fetching
+def fetch_missing_videos(video_ids, priority="interactive"):
+    videos_params = {
+        "part": "snippet,contentDetails,statistics",
+        "id": ",".join(video_ids),
+        "fields": VIDEOS_FIELDS
+    }
+    videos_data = call_youtube("videos", videos_params, priority)
+
+    # here we start processing the detailed video data we got back
+    fetched_videos = {}
+    with metrics.stage("transform"):
+        for item in videos_data.get("items", []):
+            video = build_video_result(item)
+            fetched_videos[video["videoId"]] = video
+
+    video_cache.set_many(fetched_videos)
+    return fetched_videos
+
+
+# this does the two YouTube calls for one page of search results and returns the page we send to the frontend.
+# if anything goes wrong it raises an exception (requests' RequestException, our YouTubeAPIError or QuotaExhausted)
+# and the endpoint decides what to tell the user.
+def fetch_search_page(query, max_results, order, page_token, video_duration=None, priority="interactive"):
+    video_ids, next_page_token = search_video_ids(query, max_results, order, page_token, video_duration, priority)
+
+    # now that we have the video IDs, we make another API call to get more details about each video
+    # the first API call only gives us the list of video ids. this one gets us the titles, view counts, durations, etc.
+    videos = fetch_video_details(video_ids, priority)
+    return build_page(video_ids, videos, next_page_token)
+
+
+# we load the results array with the info we want to send back to the frontend,
+# keeping the same order YouTube's search gave us. videos YouTube didn't return details for are skipped.
+def build_page(video_ids, videos, next_page_token):
+    with metrics.stage("transform"):
+        return {
+            "results": [videos[video_id] for video_id in video_ids if video_id in videos],
+            "nextPageToken": next_page_token
+        }
+
+
+# this is the search.list half of a search: it hands back the list of video IDs and the next page token.
+def search_video_ids(query, max_results, order, page_token, video_duration=None, priority="interactive"):
+    # this kind of puts this all together - I'm preparing the parameters for the YouTube search API call.
+    # part=id is all we need: the titles, thumbnails etc. come from the videos.list call afterwards
+    search_params = {
+        "part": "id",
+        "fields": SEARCH_FIELDS,
+        "q": query,
+        "type": "video",
+        "maxResults": max_results,
+        "order": order
+    }
+
+    # when the frontend asks for a later page (infinite scroll), we pass YouTube's pageToken along.
+    if page_token:
+        search_params["pageToken"] = page_token
+
+    # when a duration filter is on, YouTube can do a rough first pass for us (short, medium or long)
+    if video_duration:
+        search_params["videoDuration"] = video_duration
+
+    #its time to make api calls to youtube's search and videos endpoints. there's two api calls here. one to search for videos, and another to get details about those videos.
+    # i've included sample responses from both api calls in the backend/sample_responses folder for reference.
+
+    # now im making the actual API call to Youtube's search endpoint.
+    # so the user calls my python app's search endpoint, and then my app calls Youtube's search endpoint.
+    # call_youtube picks an API key with enough quota left, then uses our upstream helper (see upstream.py)
+    # to make the GET request. it sends it over a pooled requests session, so we reuse an already-open
+    # connection to YouTube instead of making a new one each time.
+    # if the response has an error status code, it throws an exception (after a couple of retries for 5xx errors)
+    # and otherwise hands back the JSON data, which we put into a variable called search_data
+    search_data = call_youtube("search", search_params, priority)
+
+    # if the YouTube API returned an error in its JSON response, handle that too
+    # this is different from a network error - it's when the API call succeeds but YouTube says something's wrong
+    if "error" in search_data:
+        raise YouTubeAPIError(search_data["error"])
+
+    # if all is well, we proceed to process the search results
+    # we extract the list of video items and the nextPageToken for pagination. the js frontend uses the token to load more results as you scroll.
+    items = search_data.get("items", [])
+    next_page_token = search_data.get("nextPageToken")
+
+    #this line extracts the video IDs from the search results
+    # it's a very pythonic way of doing what in JS would be a combination of .map and .filter
+    # essentially the json has a bunch of stuff in it. we only want the video IDs from the "id" field of each item
+    # so we loop through each item, check if "videoId" exists in the "id" field, and if so, we grab it
+    # and the result is an array of video IDs
+    video_ids = [item["id"]["videoId"] for item in items if "videoId" in item.get("id", {})]
+    return video_ids, next_page_token
+
+
+# "cats", " cats" and "cats  videos " are the same search as far as YouTube is concerned, so we tidy up
+# the spaces before using a query. that way they also share one cache entry and one single-flight call.
+def normalize_query(query):
+    return " ".join(query.split())
+
+
+# the cache key for a page is just the things that change what YouTube sends back, turned into a string.
+def search_cache_key(query, max_results, order, page_token, video_duration=None):
+    return json.dumps([query, max_results, order, page_token, video_duration])
+
+
+# this gets one page of search results, from the cache if we can, otherwise from YouTube.
+# search_flight makes sure that if 20 people search for the same thing at the same moment,
+# only one of them actually calls YouTube and the other 19 share the answer.
+# if we're out of quota, we fall back to an expired copy of the page (if we have one) marked with "stale": true.
+def get_search_page(query, max_results, order, page_token, video_duration=None, priority="interactive"):
+    cache_key = search_cache_key(query, max_results, order, page_token, video_duration)
+
+    # maybe we guessed this page would be wanted and already fetched it in the background
+    # (the prefetch put it in search_cache too). this goes first so the prefetcher knows its guess paid off.
+    # if the prefetch hasn't started yet, take() calls it off. if it's running, we join it through search_flight below.
+    prefetched_page = prefetcher.take(cache_key)
+    if prefetched_page is not None:
+        return prefetched_page
+
+    # before bothering YouTube, check whether we've answered this exact question recently.
+    cached_page = search_cache.get(cache_key)
+    if cached_page is not None:
+        return cached_page
+
+    # not cached, so we have to go to YouTube. this is the function that actually does it, then remembers the page.
+    loaded = []
+    def load_page():
+        page = fetch_search_page(query, max_results, order, page_token, video_duration, priority)
+        search_cache.set(cache_key, page)
+        loaded.append(True)
+        return page
+
+    try:
+        page = search_flight.do(cache_key, load_page, recheck=lambda: search_cache.recheck(cache_key))
+        # we didn't fetch it ourselves, so we joined a fetch already running. if that was a prefetch, it paid off.
+        if not loaded:
+            prefetcher.claim(cache_key)
+        return page
+    except QuotaExhausted:
+        stale_page = search_cache.get_stale(cache_key)
+        if stale_page is None:
+            raise
+        return {**stale_page, "stale": True}
+
+
+# this kicks off background fetches of the next `depth` pages after page_token, one after the other.
+# they run as "background" priority, so they never use the quota reserved for people actually searching.
+# pages we already have, or that are already being prefetched, are skipped.
+def prefetch_next_pages(query, max_results, order, page_token, depth):
+    if not page_token or depth <= 0:
+        return
+    cache_key = search_cache_key(query, max_results, order, page_token)
+    if search_cache.peek(cache_key):
+        return
+
+    # like load_page in get_search_page, this remembers the page in search_cache as well,
+    # so a request that joins this fetch leaves it cached just as if it had fetched it itself
+    loaded = []
+    def load_page():
+        page = fetch_search_page(query, max_results, order, page_token, priority="background")
+        search_cache.set(cache_key, page)
+        loaded.append(True)
+        return page
+
+    def fetch():
+        # the user may have fetched this page themselves while we were waiting for a free worker
+        if search_cache.peek(cache_key):
+            return None
+        # going through search_flight means that if the user asks for this page while we're still
+        # fetching it, their request just waits for ours instead of calling YouTube again.
+        # if it's the other way round (we joined theirs), there's nothing for us to keep.
+        page = search_flight.do(cache_key, load_page)
+        return page if loaded else None
+
+    prefetcher.schedule(
+        cache_key, fetch,
+        on_done=lambda page: prefetch_next_pages(query, max_results, order, page["nextPageToken"], depth - 1)
+    )
+
+
+# a filtered page can stop halfway through one of YouTube's pages, so a plain pageToken isn't enough to resume.
+# our cursor is YouTube's pageToken plus how many videos of that page we've already gone through,
+# packed into a URL-safe string so the frontend can just hand it back to us.
+def encode_cursor(page_token, offset):
+    raw = json.dumps([page_token, offset]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+# the reverse of encode_cursor. anything that doesn't decode properly raises a ValueError.
+def decode_cursor(cursor):
+    if not cursor:
+        return None, 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        page_token, offset = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return page_token, offset
+
+
+# this works out which of YouTube's rough duration buckets (if any) fully covers our range,
+# so YouTube can skip videos that could never match before we even see them.
+def youtube_duration_bucket(min_seconds, max_seconds):
+    for name, (low, high) in DURATION_FILTERS.items():
+        if (min_seconds or 0) >= low and (high is None or (max_seconds is not None and max_seconds <= high)):
+            return name
+    return None
+
+
+# this keeps walking YouTube's pages until we've found max_results videos in the duration range,
+# or we've used up FILTER_PAGE_BUDGET pages. the returned nextCursor picks up exactly where we stopped,
+# so the next request doesn't look at the same videos again.
+def fetch_filtered_page(query, max_results, order, page_token, offset, min_seconds, max_seconds):
+    video_duration = youtube_duration_bucket(min_seconds, max_seconds)
+
+    results = []
+    stale = False
+    for _ in range(FILTER_PAGE_BUDGET):
+        page = get_search_page(query, FILTER_PAGE_SIZE, order, page_token, video_duration)
+        stale = stale or page.get("stale", False)
+        videos = page["results"]
+        for index in range(offset, len(videos)):
+            seconds = videos[index]["durationSeconds"]
+            if min_seconds is not None and seconds < min_seconds:
+                continue
+            if max_seconds is not None and seconds > max_seconds:
+                continue
+            results.append(videos[index])
+            if len(results) == max_results:
+                # page full. if there are videos left on this YouTube page, resume right after this one
+                if index + 1 < len(videos):
+                    return filtered_page(results, encode_cursor(page_token, index + 1), stale)
+                next_token = page["nextPageToken"]
+                return filtered_page(results, encode_cursor(next_token, 0) if next_token else None, stale)
+
+        # this YouTube page is used up, move on to the next one from the start
+        page_token = page["nextPageToken"]
+        offset = 0
+        if not page_token:
+            # no more pages at all - this is the last batch of results
+            return filtered_page(results, None, stale)
+
+    # out of page budget. send what we found and let the next request continue from the next page.
+    return filtered_page(results, encode_cursor(page_token, 0), stale)
+
+
+# the response shape for a filtered page. "stale" only shows up if some of it came from expired cache entries.
+def filtered_page(results, next_cursor, stale):
+    page = {"results": results, "nextCursor": next_cursor}
+    if stale:
+        page["stale"] = True
+    return page
+
+
 # Okay, this is where I define one of my API endpoints. Think of an "endpoint" like a phone number
 # when a user calls that phone number (e.g. by clicking a button), we direct them to here.
 # the closest thing I can compare that to in frontend JS is an event listener that waits for a user action.
 # an endpoint is just a URL path your backend listens for
 @app.route("/api/search")
 def search_videos():
+    # the clock for the "parse" stage, which covers reading and checking the parameters below
+    parse_started = time.perf_counter()
+
     # if you look at the JS, you'll see that there's a part of the code that makes a request to /api/search
     # with some query parameters (like q, maxResults, sort, pageToken).
     # Here, I'm grabbing those parameters from the request and declaring them as variables.
     
     # q is what the user typed into the search box
-    query = request.args.get("q")
+    query = normalize_query(request.args.get("q", ""))
     if not query:
         return jsonify({"error": "Missing search query"}), 400
 
-    # maxResults is how many results to return (default to 12 if not provided) - the js frontend sets this to 12
-    max_results = int(request.args.get("maxResults", 12))
-    
     # sort is how to sort the results. The JS app doesn't yet let the user dictate different sortings, but I've included it for future use.
     # order then translates that using that helper dictionary I defined earlier. again, the js frontend sets this to "relevance"
     sort_key = request.args.get("sort", "relevance")
     order = ORDER_MAP.get(sort_key, "relevance")
     
-    # pageToken is for pagination. in this version, the js frontend doesn't use it yet, but it's here for future use.
+    # pageToken is for pagination. the js frontend sends it when the user scrolls to the bottom of the results.
     page_token = request.args.get("pageToken", None)
 
-    # this kind of puts this all together - I'm preparing the parameters for the YouTube search API call.
-    search_params = {
-        "part": "snippet",
-        "q": query,
-        "type": "video",
-        "maxResults": max_results,
-        "order": order,
-        "key": YOUTUBE_API_KEY
-    }
+    # prefetch=1 means "I'll probably want the next page too, go get it in the background"
+    prefetch = request.args.get("prefetch") in ("1", "true")
 
-    # this is here for show. We don't actually use pageToken in the current frontend, but if we did, this is how we'd add it to the params.
-    if page_token:
-        search_params["pageToken"] = page_token
+    # these are the optional duration filters. either a named one (filter=short|medium|long)
+    # or your own range in seconds (minSeconds / maxSeconds). with none of them, nothing gets filtered.
+    duration_filter = request.args.get("filter")
+    if duration_filter and duration_filter not in DURATION_FILTERS:
+        return jsonify({"error": f"Unknown filter: {duration_filter}"}), 400
+    try:
+        # maxResults is how many results to return (default to 12 if not provided) - the js frontend sets this to 12
+        max_results = int(request.args.get("maxResults", 12))
+        min_seconds, max_seconds = DURATION_FILTERS.get(duration_filter, (None, None))
+        if request.args.get("minSeconds"):
+            min_seconds = int(request.args["minSeconds"])
+        if request.args.get("maxSeconds"):
+            max_seconds = int(request.args["maxSeconds"])
+    except ValueError:
+        return jsonify({"error": "maxResults, minSeconds and maxSeconds must be whole numbers"}), 400
+    # these would never find anything, but a filtered search would still burn its whole page budget looking
+    if max_results < 1:
+        return jsonify({"error": "maxResults must be at least 1"}), 400
+    if min_seconds is not None and max_seconds is not None and min_seconds > max_seconds:
+        return jsonify({"error": "minSeconds can't be more than maxSeconds"}), 400
+    filtering = min_seconds is not None or max_seconds is not None
 
-    #its time to make api calls to youtube's search and videos endpoints. there's two api calls here. one to search for videos, and another to get details about those videos.
-    # i've included sample responses from both api calls in the backend/sample_responses folder for reference.
+    # filtered searches page with our own cursor instead of YouTube's pageToken (see fetch_filtered_page)
+    if filtering:
+        try:
+            cursor_token, cursor_offset = decode_cursor(request.args.get("cursor"))
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    metrics.record_stage("parse", time.perf_counter() - parse_started)
 
-    # now im making the actual API call to Youtube's search endpoint. 
-    # so the user calls my python app's search endpoint, and then my app calls Youtube's search endpoint.
     # I'm wrapping this in a try-except block to catch any network errors or API issues. It's like a try catch in JS.
     try:
-        # we use the requests library we imported earlier to make the GET request
-        # these methods come from the requests library. we didn't create them ourselves.
-        # search_response triggers the actual network call to Youtube and holds the response
-        search_response = requests.get(YOUTUBE_SEARCH_URL, params=search_params, timeout=10)
-
-        # if the response has an error status code, raise_for_status will throw an exception
-        search_response.raise_for_status()
-
-        # this line grabs the JSON data from the response and puts it into a variable called search_data
-        search_data = search_response.json()
+        if filtering:
+            page = fetch_filtered_page(query, max_results, order, cursor_token, cursor_offset, min_seconds, max_seconds)
+        else:
+            page = get_search_page(query, max_results, order, page_token)
+            if prefetch and not page.get("stale"):
+                prefetch_next_pages(query, max_results, order, page.get("nextPageToken"), PREFETCH_DEPTH)
 
     # if there's any network error or the API returns an error status, we catch it here
     # and return a JSON error message with a 502 Bad Gateway status code
     # a 502 status code indicates that our server (the Flask app) got an invalid response from an upstream server (YouTube API)
     except requests.exceptions.RequestException as e:
         return jsonify({"error": f"Network or API error: {str(e)}"}), 502
+    except YouTubeAPIError as e:
+        return jsonify({"error": e.error}), 502
+    # if we're out of quota and had nothing cached to fall back on, tell the frontend to try again later.
+    # 503 means "temporarily unavailable", and Retry-After says how many seconds until it's worth asking again
+    except QuotaExhausted as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
 
-    # if the YouTube API returned an error in its JSON response, handle that too
-    # this is different from a network error - it's when the API call succeeds but YouTube says something's wrong
-    if "error" in search_data:
-        return jsonify({"error": search_data["error"]}), 502
+    # this is like a console log for debugging, but it doesn't make the request wait while it's written (see logs.py).
+    # with LOG_SAMPLE_RATE below 1, only some searches get logged.
+    logs.log_event(
+        log, "search",
+        query=query,
+        results=len(page["results"]),
+        next=page.get("nextPageToken") or page.get("nextCursor"),
+        stale=page.get("stale", False)
+    )
 
-    # if all is well, we proceed to process the search results
-    # we extract the list of video items and the nextPageToken for pagination. Again, the js frontend doesn't use pagination yet, but it's here for future use.
-    items = search_data.get("items", [])
-    next_page_token = search_data.get("nextPageToken")
+    # finally, we return the results as a JSON response to the frontend.
+    # stale pages shouldn't stick around in the browser, so those have to be re-checked every time.
+    with metrics.stage("serialize"):
+        response = jsonify(page)
+    response.headers["Cache-Control"] = "no-cache" if page.get("stale") else f"public, max-age={SEARCH_BROWSER_MAX_AGE}"
+    return response
 
-    #this line extracts the video IDs from the search results
-    # it's a very pythonic way of doing what in JS would be a combination of .map and .filter
-    # essentially the json has a bunch of stuff in it. we only want the video IDs from the "id" field of each item
-    # so we loop through each item, check if "videoId" exists in the "id" field, and if so, we grab it
-    # and the result is an array of video IDs
-    video_ids = [item["id"]["videoId"] for item in items if "videoId" in item.get("id", {})]
 
-    # now that we have the video IDs, we make another API call to get more details about each video
-    # the first API call only gives us the list of video ids. this one gets us the titles, view counts, durations, etc.
-    results = []
-    if video_ids:
-        videos_params = {
-            "part": "snippet,contentDetails,statistics",
-            "id": ",".join(video_ids),
-            "key": YOUTUBE_API_KEY
-        }
+# this is the batch version of /api/search, for when you need results for lots of queries at once.
+# it's a POST because the list of queries goes in the request body as JSON, like this:
+#   {"queries": [{"q": "cats", "maxResults": 12, "sort": "views", "pageToken": "..."}, {"q": "dogs"}]}
+# add "priority": "background" for batches nobody is actively waiting on, so they can't eat the quota
+# that interactive searches need.
+# it works in two steps so we make as few YouTube calls as possible:
+# 1. all the search.list calls run at the same time on the thread pool
+# 2. the video IDs from every query are pooled together (so a video that shows up in 5 queries is fetched once)
+#    and fetched with videos.list in chunks of 50, also in parallel
+# a query that fails gets its own "error" entry; the other queries still get their results.
+@app.route("/api/search/batch", methods=["POST"])
+def search_videos_batch():
+    body = request.get_json(silent=True)
+    # valid JSON that isn't an object (like [1, 2]) is just as wrong as no body at all
+    specs = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(specs, list) or not specs:
+        return jsonify({"error": "Expected a JSON body with a non-empty \"queries\" list"}), 400
+    if len(specs) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"Too many queries (max {BATCH_MAX_QUERIES})"}), 400
+    priority = body.get("priority", "interactive")
+    if priority not in PRIORITIES:
+        return jsonify({"error": f"Unknown priority: {priority}"}), 400
 
-        # this syntax is similar to the previous try-except block for error handling
+    # one entry per query, in the same order they were sent. each one ends up with either a page or an error.
+    entries = []
+    for spec in specs:
+        entry = {"q": spec.get("q") if isinstance(spec, dict) else None}
+        entries.append(entry)
+        if not entry["q"]:
+            entry["error"] = "Missing search query"
+            continue
+        # this is JSON, so any of these could be a list or a number instead of the string we expect
+        sort_key = spec.get("sort", "relevance")
+        page_token = spec.get("pageToken")
+        if not isinstance(entry["q"], str):
+            entry["error"] = "q must be a string"
+            continue
+        query = normalize_query(entry["q"])
+        if not query:
+            entry["error"] = "Missing search query"
+            continue
+        if not isinstance(sort_key, str):
+            entry["error"] = "sort must be a string"
+            continue
+        if page_token is not None and not isinstance(page_token, str):
+            entry["error"] = "pageToken must be a string"
+            continue
         try:
-            videos_response = requests.get(YOUTUBE_VIDEOS_URL, params=videos_params, timeout=10)
-            videos_response.raise_for_status()
-            videos_data = videos_response.json()
-        except requests.exceptions.RequestException as e:
-            return jsonify({"error": f"Network or API error: {str(e)}"}), 502
+            max_results = int(spec.get("maxResults", 12))
+        except (TypeError, ValueError):
+            entry["error"] = "maxResults must be a whole number"
+            continue
+        if not 1 <= max_results <= SEARCH_MAX_RESULTS:
+            entry["error"] = f"maxResults must be between 1 and {SEARCH_MAX_RESULTS}"
+            continue
+        entry["args"] = (query, max_results, ORDER_MAP.get(sort_key, "relevance"), page_token)
 
-        # here we start processing the detailed video data we got back
-        for item in videos_data.get("items", []):
-            snippet = item.get("snippet", {})
-            stats = item.get("statistics", {})
-            content = item.get("contentDetails", {})
-
-            # we load the results array with the info we want to send back to the frontend
-            results.append({
-                "videoId": item.get("id"),
-                "title": snippet.get("title"),
-                "channel": snippet.get("channelTitle"),
-                "views": int(stats.get("viewCount", 0)),
-                "published_at": snippet.get("publishedAt"),
-                "duration": content.get("duration"),
-                "thumbnail": snippet.get("thumbnails", {}).get("medium", {}).get("url")
-            })
-
-    # this is like a console log for debugging. instead of the console tab, it prints to the terminal where the Flask app is running.
-    print(f"✅ Query: {query}, Results: {len(results)}, Next token: {next_page_token}")
-
-    # finally, we return the results as a JSON response to the frontend
+        # pages we've already got cached don't need any YouTube calls at all
+        cached_page = search_cache.get(search_cache_key(*entry["args"]))
+        if cached_page is not None:
+            entry["page"] = cached_page
+
+    # step 1: search.list for everything that wasn't cached, all at once on the pool.
+    # search_flight (with a separate "ids:" key) still stops two identical searches from running together.
+    def search_ids(args):
+        key = "ids:" + search_cache_key(*args)
+        return search_flight.do(key, lambda: search_video_ids(*args, priority=priority))
+
+    # when a query fails because we're out of quota, an expired copy of its page is still better than an error
+    def fail(entry, error):
+        stale_page = search_cache.get_stale(search_cache_key(*entry["args"])) if isinstance(error, QuotaExhausted) else None
+        if stale_page is not None:
+            entry["page"] = {**stale_page, "stale": True}
+        else:
+            entry["error"] = describe_upstream_error(error)
+
+    pending = [entry for entry in entries if "args" in entry and "page" not in entry]
+    futures = [(entry, submit_upstream(search_ids, entry["args"])) for entry in pending]
+    for entry, future in futures:
+        found, error = future.result()
+        if error is not None:
+            fail(entry, error)
+        else:
+            entry["video_ids"], entry["next_page_token"] = found
+
+    # step 2: details for every video ID from every query, with duplicates removed, in 50-ID chunks
+    all_ids = [video_id for entry in entries for video_id in entry.get("video_ids", [])]
+    videos, errors = fetch_video_details_partial(all_ids, priority)
+
+    for entry in entries:
+        if "video_ids" not in entry:
+            continue
+        failed = [video_id for video_id in entry["video_ids"] if video_id in errors]
+        if failed:
+            fail(entry, errors[failed[0]])
+            continue
+        entry["page"] = build_page(entry["video_ids"], videos, entry["next_page_token"])
+        search_cache.set(search_cache_key(*entry["args"]), entry["page"])
+
+    # finally, tidy each entry into what the frontend gets back: the query plus its page, or the query plus its error
+    response = []
+    for entry in entries:
+        if "page" in entry:
+            response.append({"q": entry["q"], **entry["page"]})
+        else:
+            response.append({"q": entry["q"], "error": entry["error"]})
+
+    logs.log_event(
+        log, "search_batch",
+        queries=len(entries),
+        unique_videos=len(set(all_ids)),
+        errors=sum("error" in r for r in response)
+    )
+    with metrics.stage("serialize"):
+        return jsonify({"results": response})
+
+
+# turns an upstream exception into the same kind of error message /api/search sends back
+def describe_upstream_error(error):
+    if isinstance(error, YouTubeAPIError):
+        return error.error
+    if isinstance(error, QuotaExhausted):
+        return str(error)
+    return f"Network or API error: {str(error)}"
+
+
+# shows how much YouTube quota this worker has left on each key, and how much it's spent this window.
+@app.route("/api/quota")
+def quota_status():
+    return jsonify(quota.snapshot())
+
+
+# a tiny endpoint to peek at how well the caches are doing. handy when tuning the TTLs.
+# note that the counters are per gunicorn worker, even when the disk tier is shared.
+# the "coalescing" numbers show how many YouTube calls were skipped because an identical one was already running.
+@app.route("/api/cache/stats")
+def cache_stats():
     return jsonify({
-        "results": results,
-        "nextPageToken": next_page_token
+        "search": search_cache.snapshot(),
+        "videos": video_cache.snapshot(),
+        "prefetch": prefetcher.snapshot(),
+        "coalescing": {
+            "search": search_flight.snapshot(),
+            "videos": video_flight.snapshot()
+        }
     })
 
 
+# these three run around every request, so we can time it and count how many are running at once.
+# before_request starts a timer for the request, after_request puts the stage timings into the
+# Server-Timing header (visible in the browser's devtools), and teardown_request tidies up afterwards.
+@app.before_request
+def start_request_timer():
+    g.timer = metrics.RequestTimer()
+    g.timer_token = metrics.current_timer.set(g.timer)
+    metrics.requests_in_flight.inc()
+
+
+@app.after_request
+def add_server_timing(response):
+    timer = g.get("timer")
+    if timer is not None:
+        response.headers["Server-Timing"] = timer.server_timing()
+        metrics.request_seconds.observe(
+            time.perf_counter() - timer.started,
+            endpoint=request.endpoint or "unknown",
+            status=response.status_code
+        )
+    return response
+
+
+@app.teardown_request
+def finish_request_timer(error=None):
+    if "timer_token" in g:
+        metrics.current_timer.reset(g.pop("timer_token"))
+        metrics.requests_in_flight.dec()
+
+
+# faster JSON, ETags/304s and compression for every response (see responses.py).
+# Flask runs after_request hooks newest first, so registering this after add_server_timing means
+# the compression step happens first and its time shows up in the Server-Timing header too.
+responses.init_app(app)
+
+
+# this feeds the numbers that already live in the caches, single-flight and quota objects into /metrics
+def collect_app_metrics():
+    cache_hits = []
+    cache_misses = []
+    cache_entries = []
+    for cache in (search_cache, video_cache):
+        stats = cache.snapshot()
+        for tier in ("memory", "disk", "stale"):
+            cache_hits.append(({"cache": cache.name, "tier": tier}, stats[f"{tier}_hits"]))
+        cache_misses.append(({"cache": cache.name}, stats["misses"]))
+        cache_entries.append(({"cache": cache.name}, stats["memory_entries"]))
+    saved = [({"kind": flight.name}, flight.snapshot()["saved"]) for flight in (search_flight, video_flight)]
+    quota_state = quota.snapshot()
+    prefetch_state = prefetcher.snapshot()
+    return [
+        ("detube_cache_hits_total", "counter", "Cache hits by cache and tier", cache_hits),
+        ("detube_cache_misses_total", "counter", "Cache misses by cache", cache_misses),
+        ("detube_cache_memory_entries", "gauge", "Entries in the in-memory cache tier", cache_entries),
+        ("detube_upstream_calls_saved_total", "counter", "YouTube calls skipped by request coalescing", saved),
+        ("detube_quota_available_units", "gauge", "Quota units left per API key",
+         [({"key": key["key"]}, key["available"]) for key in quota_state["keys"]]),
+        ("detube_quota_denied_total", "counter", "Calls refused because the quota budget ran out",
+         [({}, quota_state["denied"])]),
+        ("detube_prefetch_pages_total", "counter", "Prefetched pages by outcome",
+         [({"outcome": outcome}, prefetch_state[outcome]) for outcome in ("hits", "wasted", "failed", "skipped_busy")]),
+        ("detube_prefetch_in_flight", "gauge", "Prefetches currently running", [({}, prefetch_state["in_flight"])]),
+        ("detube_prefetch_stored_bytes", "gauge", "Memory used by prefetched pages", [({}, prefetch_state["stored_bytes"])])
+    ]
+
+
+metrics.registry.add_collector(collect_app_metrics)
+
+
+# the metrics endpoint, in the plain-text format Prometheus scrapes. you can also just open it in a browser.
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+# all the frontend files, with fingerprinted names and precompressed copies, worked out once at startup (see assets.py)
+asset_manifest = AssetManifest(app.static_folder)
+
+
+# sends one of those files back, compressed if the browser accepts it, and with an ETag so the browser
+# can ask "has this changed?" and get a quick 304 if it hasn't
+def asset_response(asset, cache_control):
+    body, encoding = asset.body_for(request.headers.get("Accept-Encoding", ""))
+    response = app.response_class(body, mimetype=asset.mimetype)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.set_etag(asset.digest, weak=True)
+    response.headers["Cache-Control"] = cache_control
+    return response.make_conditional(request)
+
+
 # this is the route (phone number) that is called as soon as the user visits the web app in their browser
 # it serves the index.html file from the frontend static folder.
-# in other words, when the user goes to the root url, the python finds the index file and serves it up
+# in other words, when the user goes to the root url, the python finds the index file and serves it up.
+# it's the version rewritten to point at the fingerprinted CSS/JS, and since its own URL never changes,
+# "no-cache" makes the browser check back every time (usually getting a quick 304).
 @app.route("/")
 def index():
-    return send_from_directory(app.static_folder, "index.html")
+    global asset_manifest
+    # in debug mode, pick up frontend edits without restarting the server
+    if app.debug:
+        asset_manifest = AssetManifest(app.static_folder)
+    return asset_response(asset_manifest.index, "no-cache")
+
+
+# the fingerprinted frontend files. their URL changes whenever their contents do,
+# so the browser can safely keep them for a year without ever asking again.
+@app.route("/assets/<path:name>")
+def fingerprinted_asset(name):
+    asset = asset_manifest.by_fingerprint.get(name)
+    if asset is None:
+        abort(404)
+    return asset_response(asset, "public, max-age=31536000, immutable")
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,92 @@
+# -------------------------------------------------------------
+# Fingerprinted, precompressed frontend files
+# -------------------------------------------------------------
+# Browsers can keep a copy of our CSS/JS/images for a year, as long as the URL changes
+# whenever the file does. So when the app starts we:
+# 1. read every file in the frontend folder and give it a "fingerprinted" URL that includes
+#    a short hash of its contents, e.g. css/style.css -> assets/css/style.3f9a1c2b7d.css
+# 2. compress the text files (gzip, plus brotli if installed) once, up front, so we never
+#    compress them again per request
+# 3. rewrite index.html so it points at the fingerprinted URLs
+# index.html itself always keeps the same URL, so it's served with "no-cache" (the browser
+# checks with us each time, and gets a quick 304 if it hasn't changed).
+# -------------------------------------------------------------
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# the URL folder fingerprinted files are served from
+ASSET_PREFIX = "assets/"
+# these are text, so they shrink a lot when compressed. images are already compressed.
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".html", ".svg", ".json", ".txt")
+# finds src="..." and href="..." in the HTML so we can swap in fingerprinted URLs
+ASSET_REFERENCE = re.compile(r'(src|href)="([^"]+)"')
+
+
+class Asset:
+    """One frontend file, with its fingerprinted name and precompressed versions."""
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.digest = hashlib.sha256(data).hexdigest()[:10]
+        stem, ext = os.path.splitext(path)
+        self.fingerprinted = f"{stem}.{self.digest}{ext}"
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        # encoding -> compressed bytes, only kept when it actually came out smaller
+        self.encoded = {}
+        if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+            self._precompress("gzip", gzip.compress(data, compresslevel=9))
+            if brotli is not None:
+                self._precompress("br", brotli.compress(data, quality=11))
+
+    def _precompress(self, encoding, compressed):
+        if len(compressed) < len(self.data):
+            self.encoded[encoding] = compressed
+
+    def body_for(self, accept_encoding):
+        """(bytes, content encoding or None) for the best version the browser accepts."""
+        for encoding in ("br", "gzip"):
+            if encoding in self.encoded and encoding in accept_encoding:
+                return self.encoded[encoding], encoding
+        return self.data, None
+
+
+class AssetManifest:
+    """Every file in the frontend folder, looked up by original path or fingerprinted name."""
+
+    def __init__(self, folder, index="index.html"):
+        self.folder = folder
+        self.by_path = {}
+        self.by_fingerprint = {}
+        for root, _, files in os.walk(folder):
+            for name in files:
+                full_path = os.path.join(root, name)
+                path = os.path.relpath(full_path, folder).replace(os.sep, "/")
+                if path == index:
+                    continue
+                with open(full_path, "rb") as f:
+                    asset = Asset(path, f.read())
+                self.by_path[path] = asset
+                self.by_fingerprint[asset.fingerprinted] = asset
+
+        with open(os.path.join(folder, index), encoding="utf-8") as f:
+            html = ASSET_REFERENCE.sub(self._rewrite_reference, f.read())
+        # the rewritten page is an asset too (compressed once up front), just without a fingerprinted URL
+        self.index = Asset(index, html.encode("utf-8"))
+
+    def _rewrite_reference(self, match):
+        attribute, url = match.groups()
+        asset = self.by_path.get(url)
+        if asset is None:
+            # external URLs (like the Bootstrap CDN) and anything we don't know about stay as they are
+            return match.group(0)
+        return f'{attribute}="{ASSET_PREFIX}{asset.fingerprinted}"'
@@ -0,0 +1,293 @@
+# -------------------------------------------------------------
+# Caching helpers for the search endpoint
+# -------------------------------------------------------------
+# Every YouTube API call costs quota units and a few hundred ms, so we try hard
+# not to ask YouTube the same question twice. This file has three small pieces:
+# - MemoryCache: a per-process dictionary with a time-to-live (TTL) and
+#   least-recently-used (LRU) eviction. Fast, but every gunicorn worker has its own.
+# - SQLiteCache: an optional on-disk tier. It's a single SQLite file, so every
+#   gunicorn worker on the machine reads and writes the same entries.
+# - TieredCache: glues the two together and keeps hit/miss counters.
+# Entries past their TTL aren't thrown away straight away. They're kept (up to stale_ttl) so that,
+# if we can't reach YouTube or run out of quota, we can still serve an old answer marked as stale.
+# Values are stored as JSON, so anything we cache has to be plain dicts/lists/strings/numbers.
+# -------------------------------------------------------------
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# recording "last used" is a write, and every worker shares SQLite's one write lock.
+# so a disk hit only refreshes accessed_at once it's older than this share of the TTL -
+# plenty accurate for deciding what to evict.
+TOUCH_AFTER_TTL_FRACTION = 0.25
+# SQLite limits how many ? placeholders one statement can have, so big lookups go in slices
+SQLITE_MAX_KEYS_PER_QUERY = 500
+
+
+class MemoryCache:
+    """In-process cache with a per-entry TTL and LRU eviction."""
+
+    def __init__(self, max_entries=1024, ttl=600, stale_ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # how long an expired entry is kept around for get(key, max_age=stale_ttl)
+        self.stale_ttl = max(stale_ttl or ttl, ttl)
+        # an OrderedDict remembers insertion order, and move_to_end() lets us
+        # bump an entry to "most recently used" in O(1). The oldest entry is always first.
+        self._entries = OrderedDict()
+        # gunicorn's threaded workers can touch the cache from several threads at once
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        """Return (value, stored_at) if the entry is younger than max_age (default: the TTL), else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age > self.stale_ttl:
+                # too old to ever be useful again - forget it
+                del self._entries[key]
+                return None
+            if age > (max_age if max_age is not None else self.ttl):
+                return None
+            self._entries.move_to_end(key)
+            return value, stored_at
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._entries[key] = (value, stored_at if stored_at is not None else time.time())
+            self._entries.move_to_end(key)
+            # evict least recently used entries until we're back under the limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """On-disk cache shared by every process that opens the same file."""
+
+    def __init__(self, path, namespace, max_entries=10000, ttl=600, stale_ttl=None):
+        self.path = path
+        # one file holds several caches (search pages, video details), the namespace keeps them apart
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl or ttl, ttl)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connect(self):
+        # sqlite connections can't be shared across threads, or across a fork,
+        # so each thread in each worker process opens its own.
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        # WAL mode lets readers keep reading while another worker is writing
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, max_age=None):
+        """Return (value, stored_at) if the entry is younger than max_age (default: the TTL), else None."""
+        return self.get_many([key], max_age=max_age).get(key)
+
+    def get_many(self, keys, max_age=None):
+        """Look up several keys with one SELECT per slice. Returns {key: (value, stored_at)} for the fresh ones."""
+        found = {}
+        max_age = max_age if max_age is not None else self.ttl
+        keys = list(dict.fromkeys(keys))
+        try:
+            conn = self._connect()
+            now = time.time()
+            touches = []
+            for i in range(0, len(keys), SQLITE_MAX_KEYS_PER_QUERY):
+                chunk = keys[i:i + SQLITE_MAX_KEYS_PER_QUERY]
+                rows = conn.execute(
+                    "SELECT key, value, stored_at, accessed_at FROM cache"
+                    f" WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                    (self.namespace, *chunk),
+                ).fetchall()
+                for key, value, stored_at, accessed_at in rows:
+                    if now - stored_at > max_age:
+                        continue
+                    found[key] = (json.loads(value), stored_at)
+                    if now - accessed_at > self.ttl * TOUCH_AFTER_TTL_FRACTION:
+                        touches.append((now, self.namespace, key))
+            if touches:
+                conn.executemany("UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?", touches)
+        except sqlite3.Error:
+            # the disk tier is a nice-to-have. If the file is locked or broken, whatever we
+            # didn't manage to read just counts as a miss.
+            pass
+        return found
+
+    def set(self, key, value, stored_at=None):
+        self.set_many({key: value}, stored_at=stored_at)
+
+    def set_many(self, mapping, stored_at=None):
+        """Store several entries in one transaction: one trip through the shared write lock instead of one per key."""
+        if not mapping:
+            return
+        now = time.time()
+        rows = [(self.namespace, key, json.dumps(value), stored_at or now, now) for key, value in mapping.items()]
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, stored_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            # trimming on every write would be wasteful, so only do it every 100 or so entries
+            before = self._writes
+            self._writes += len(rows)
+            if self._writes // 100 != before // 100:
+                self.prune()
+        except sqlite3.Error:
+            pass
+
+    def prune(self):
+        """Drop expired rows, then the least recently used rows over max_entries."""
+        conn = self._connect()
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND stored_at < ?",
+            (self.namespace, time.time() - self.stale_ttl),
+        )
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ?"
+            " ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
+        )
+
+
+class TieredCache:
+    """Memory tier in front of an optional SQLite tier, with hit/miss counters."""
+
+    def __init__(self, name, max_entries=1024, ttl=600, stale_ttl=None, db_path=None, db_max_entries=10000):
+        self.name = name
+        self.stale_ttl = max(stale_ttl or ttl, ttl)
+        self.memory = MemoryCache(max_entries=max_entries, ttl=ttl, stale_ttl=stale_ttl)
+        # no db_path means no disk tier - handy for local development
+        self.disk = SQLiteCache(
+            db_path, name, max_entries=db_max_entries, ttl=ttl, stale_ttl=stale_ttl
+        ) if db_path else None
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale_hits": 0, "sets": 0}
+
+    def _count(self, field, amount=1):
+        with self._lock:
+            self.stats[field] += amount
+
+    def _lookup(self, key, max_age=None):
+        found = self.memory.get(key, max_age=max_age)
+        if found is not None:
+            return found[0], "memory"
+        if self.disk is not None:
+            found = self.disk.get(key, max_age=max_age)
+            if found is not None:
+                value, stored_at = found
+                # promote it to the memory tier so the next lookup skips the disk,
+                # keeping the original timestamp so it still expires on time
+                self.memory.set(key, value, stored_at=stored_at)
+                return value, "disk"
+        return None, None
+
+    def get(self, key):
+        value, tier = self._lookup(key)
+        self._count(f"{tier}_hits" if tier else "misses")
+        return value
+
+    def recheck(self, key):
+        """Like get(), but without touching the counters. For looking again after a miss was already counted."""
+        return self._lookup(key)[0]
+
+    def peek(self, key):
+        """True if a fresh copy is in the memory tier. Doesn't touch the hit/miss counters."""
+        return self.memory.get(key) is not None
+
+    def get_stale(self, key):
+        """Like get(), but also accepts entries past their TTL (up to stale_ttl). For when YouTube can't be asked."""
+        value, tier = self._lookup(key, max_age=self.stale_ttl)
+        if tier:
+            self._count("stale_hits")
+        return value
+
+    def set(self, key, value):
+        now = time.time()
+        self.memory.set(key, value, stored_at=now)
+        if self.disk is not None:
+            self.disk.set(key, value, stored_at=now)
+        self._count("sets")
+
+    def get_many(self, keys):
+        """Look up several keys at once. Returns a dict of only the keys that were found.
+
+        Whatever isn't in memory is fetched from the disk tier in one go rather than key by key.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        missing = []
+        for key in keys:
+            hit = self.memory.get(key)
+            if hit is not None:
+                found[key] = hit[0]
+            else:
+                missing.append(key)
+        memory_hits = len(found)
+        if missing and self.disk is not None:
+            for key, (value, stored_at) in self.disk.get_many(missing).items():
+                # same promotion to the memory tier as in _lookup, keeping the original timestamp
+                self.memory.set(key, value, stored_at=stored_at)
+                found[key] = value
+        disk_hits = len(found) - memory_hits
+        with self._lock:
+            self.stats["memory_hits"] += memory_hits
+            self.stats["disk_hits"] += disk_hits
+            self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def set_many(self, mapping):
+        now = time.time()
+        for key, value in mapping.items():
+            self.memory.set(key, value, stored_at=now)
+        if self.disk is not None:
+            self.disk.set_many(mapping, stored_at=now)
+        self._count("sets", len(mapping))
+
+    def snapshot(self):
+        """Counters plus a hit rate, ready to be sent back as JSON."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["disk_enabled"] = self.disk is not None
+        return stats
@@ -0,0 +1,127 @@
+# -------------------------------------------------------------
+# A fake YouTube API for offline testing and load tests
+# -------------------------------------------------------------
+# This is a tiny stand-in for googleapis.com that answers search.list and videos.list
+# using the real responses saved in backend/sample responses/. It never touches the internet,
+# so you can hammer it as much as you like without spending any quota.
+#
+# To point the app at it, start this server and set these before starting app.py / gunicorn:
+#   YOUTUBE_SEARCH_URL=http://127.0.0.1:8081/youtube/v3/search
+#   YOUTUBE_VIDEOS_URL=http://127.0.0.1:8081/youtube/v3/videos
+#
+# Run it with:  python fake_youtube.py --port 8081 --latency 150 --jitter 50 --error-rate 0.01 --pages 5
+# - latency / jitter: how long each answer takes, in milliseconds (latency +/- a random jitter)
+# - error-rate: the share of calls (0 to 1) that fail with a 503, to exercise retries
+# - pages: how many pages of results each search has before nextPageToken runs out
+# -------------------------------------------------------------
+
+import argparse
+import copy
+import hashlib
+import json
+import os
+import random
+import time
+
+from flask import Flask, request, jsonify
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample responses")
+
+# the saved responses: one search.list page and one videos.list page
+with open(os.path.join(SAMPLES_DIR, "sample api call 1.json"), encoding="utf-8") as f:
+    SEARCH_SAMPLE = json.load(f)
+with open(os.path.join(SAMPLES_DIR, "sample api call 2.json"), encoding="utf-8") as f:
+    VIDEOS_SAMPLE = json.load(f)
+
+app = Flask(__name__)
+
+# these get overwritten by the command line flags in main()
+settings = {"latency": 0.0, "jitter": 0.0, "error_rate": 0.0, "pages": 5}
+
+
+def fake_video_id(query, page, index):
+    """Make up a stable, 11 character video ID for result number `index` on `page` of `query`."""
+    digest = hashlib.sha1(f"{query}|{page}|{index}".encode("utf-8")).hexdigest()
+    return digest[:11]
+
+
+def pick(items, video_id):
+    """Choose which sample item to use as the template for a made-up video, the same one every time."""
+    return copy.deepcopy(items[int(video_id, 16) % len(items)])
+
+
+def simulate_network():
+    """Sleep for the configured latency and maybe fail. Returns an error response, or None if all is well."""
+    delay = settings["latency"] + random.uniform(-settings["jitter"], settings["jitter"])
+    if delay > 0:
+        time.sleep(delay / 1000)
+    if random.random() < settings["error_rate"]:
+        return jsonify({"error": {"code": 503, "message": "Fake backend error"}}), 503
+    return None
+
+
+@app.route("/youtube/v3/search")
+def search_list():
+    error = simulate_network()
+    if error is not None:
+        return error
+
+    query = request.args.get("q", "")
+    max_results = min(int(request.args.get("maxResults", 5)), 50)
+    # our page tokens are just the page number, which is plenty for a fake
+    page = int(request.args.get("pageToken") or 0)
+
+    items = []
+    for index in range(max_results):
+        video_id = fake_video_id(query, page, index)
+        item = pick(SEARCH_SAMPLE["items"], video_id)
+        item["id"]["videoId"] = video_id
+        items.append(item)
+
+    response = {key: value for key, value in SEARCH_SAMPLE.items() if key not in ("items", "nextPageToken")}
+    response["pageInfo"] = {"totalResults": settings["pages"] * max_results, "resultsPerPage": max_results}
+    response["items"] = items
+    if page + 1 < settings["pages"]:
+        response["nextPageToken"] = str(page + 1)
+    return jsonify(response)
+
+
+@app.route("/youtube/v3/videos")
+def videos_list():
+    error = simulate_network()
+    if error is not None:
+        return error
+
+    video_ids = [video_id for video_id in request.args.get("id", "").split(",") if video_id]
+    if len(video_ids) > 50:
+        # the real API refuses more than 50 IDs, so the fake does too
+        return jsonify({"error": {"code": 400, "message": "Too many IDs"}}), 400
+
+    items = []
+    for video_id in video_ids:
+        item = pick(VIDEOS_SAMPLE["items"], video_id)
+        item["id"] = video_id
+        items.append(item)
+
+    response = {key: value for key, value in VIDEOS_SAMPLE.items() if key != "items"}
+    response["items"] = items
+    response["pageInfo"] = {"totalResults": len(items), "resultsPerPage": len(items)}
+    return jsonify(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake YouTube search.list / videos.list responses.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds per response")
+    parser.add_argument("--jitter", type=float, default=0, help="+/- milliseconds of random variation")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of calls (0-1) that fail with a 503")
+    parser.add_argument("--pages", type=int, default=5, help="pages of results per search")
+    args = parser.parse_args()
+
+    settings.update(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, pages=args.pages)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
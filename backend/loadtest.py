@@ -0,0 +1,215 @@
+# -------------------------------------------------------------
+# Load test for /api/search, fully offline
+# -------------------------------------------------------------
+# This starts the fake YouTube server (fake_youtube.py), starts the real app under gunicorn
+# pointed at it, then fires requests at /api/search with more and more clients at once.
+# For each concurrency level it reports requests per second and p50/p95/p99 latency,
+# and writes everything to a JSON file you can keep as a baseline.
+#
+# Run it from the backend folder:
+#   python loadtest.py --output loadtest_results.json
+# and later, to see whether a change made things slower:
+#   python loadtest.py --compare loadtest_results.json --output new_results.json
+#
+# --queries controls how many different search terms get used. A small number means mostly
+# cache hits, a big one means mostly trips to the (fake) YouTube API.
+# -------------------------------------------------------------
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    """Ask the OS for a port nobody is using."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} didn't come up within {timeout}s")
+
+
+def percentile(sorted_values, pct):
+    """The value below which pct percent of the (already sorted) values fall."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_level(base_url, concurrency, duration, queries, max_results):
+    """Hammer /api/search with `concurrency` clients for `duration` seconds and summarize what happened."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client():
+        # each client keeps its own connection open, like a browser would
+        session = requests.Session()
+        my_latencies = []
+        my_statuses = {}
+        while time.time() < stop_at:
+            query = random.choice(queries)
+            started = time.perf_counter()
+            try:
+                response = session.get(
+                    f"{base_url}/api/search", params={"q": query, "maxResults": max_results}, timeout=30
+                )
+                status = response.status_code
+            except requests.exceptions.RequestException:
+                status = "network_error"
+            my_latencies.append((time.perf_counter() - started) * 1000)
+            my_statuses[status] = my_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(my_latencies)
+            for status, count in my_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) or 0, 2),
+        "p95_ms": round(percentile(latencies, 95) or 0, 2),
+        "p99_ms": round(percentile(latencies, 99) or 0, 2),
+        "statuses": {str(status): count for status, count in statuses.items()}
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print how each level moved compared to the baseline. Returns True if anything got worse than tolerance."""
+    regressed = False
+    old_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in results["levels"]:
+        old = old_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        for metric, higher_is_better in (("requests_per_second", True), ("p50_ms", False), ("p95_ms", False), ("p99_ms", False)):
+            if not old[metric]:
+                continue
+            change = (level[metric] - old[metric]) / old[metric]
+            worse = -change if higher_is_better else change
+            flag = "  <-- regression" if worse > tolerance else ""
+            regressed = regressed or bool(flag)
+            print(f"  c={level['concurrency']:<4} {metric:<20} {old[metric]:>10} -> {level[metric]:>10} ({change:+.1%}){flag}")
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for /api/search against a fake YouTube API.")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma separated client counts to step through")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run each concurrency level")
+    parser.add_argument("--queries", type=int, default=200, help="how many distinct search terms to draw from")
+    parser.add_argument("--max-results", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--worker-class", default="gthread", help="gunicorn worker class (e.g. gthread, gevent)")
+    parser.add_argument("--latency", type=float, default=120, help="fake YouTube latency in ms")
+    parser.add_argument("--jitter", type=float, default=40, help="fake YouTube jitter in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake YouTube error rate (0-1)")
+    parser.add_argument("--pages", type=int, default=5, help="fake YouTube pages per search")
+    parser.add_argument("--output", default="loadtest_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="a previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="how much worse (0.10 = 10%%) counts as a regression")
+    args = parser.parse_args()
+
+    fake_port = free_port()
+    app_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    env = dict(os.environ)
+    env.update({
+        "YOUTUBE_SEARCH_URL": f"{fake_url}/youtube/v3/search",
+        "YOUTUBE_VIDEOS_URL": f"{fake_url}/youtube/v3/videos",
+        "YOUTUBE_API_KEY": "loadtest",
+        # the fake API is free, so give the quota bookkeeper an effectively unlimited budget
+        "QUOTA_UNITS_PER_KEY": str(10 ** 12)
+    })
+
+    fake = subprocess.Popen(
+        [sys.executable, "fake_youtube.py", "--port", str(fake_port), "--latency", str(args.latency),
+         "--jitter", str(args.jitter), "--error-rate", str(args.error_rate), "--pages", str(args.pages)],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--threads", str(args.threads),
+         "-k", args.worker_class, "-b", f"127.0.0.1:{app_port}", "app:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(f"{fake_url}/youtube/v3/videos")
+        wait_until_up(f"{app_url}/api/quota")
+
+        queries = [f"loadtest query {i}" for i in range(args.queries)]
+        levels = []
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            level = run_level(app_url, concurrency, args.duration, queries, args.max_results)
+            levels.append(level)
+            print(f"c={concurrency:<4} {level['requests_per_second']:>8} req/s  p50 {level['p50_ms']}ms"
+                  f"  p95 {level['p95_ms']}ms  p99 {level['p99_ms']}ms  {level['statuses']}")
+    finally:
+        server.terminate()
+        fake.terminate()
+        server.wait()
+        fake.wait()
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "tolerance")},
+        "levels": levels
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Compared to {args.compare} ({baseline.get('git_commit')}):")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -------------------------------------------------------------
+# Structured, non-blocking logging
+# -------------------------------------------------------------
+# print() writes straight to the terminal while the request waits, and the output is just a
+# sentence that's hard to search through. Here each log line is a JSON object instead
+# (e.g. {"event": "search", "query": "cats", "results": 12}), and the actual writing happens
+# on a background thread: the request just drops the log record in a queue and moves on.
+#
+# Busy servers don't need a line for every single search, so LOG_SAMPLE_RATE (0 to 1) lets you
+# keep only a share of them. Warnings and errors are always kept.
+# LOG_LEVEL works like usual (DEBUG, INFO, WARNING...).
+# -------------------------------------------------------------
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+_queue = queue.SimpleQueue()
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a log record as one line of JSON."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "event": record.getMessage(),
+            "pid": record.process
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _ensure_listener():
+    # the background writer thread has to be started in each gunicorn worker,
+    # since threads don't come along when a process forks
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JSONFormatter())
+        _listener = logging.handlers.QueueListener(_queue, stream)
+        _listener.start()
+        _listener_pid = os.getpid()
+        # flush whatever is still queued when the worker shuts down
+        atexit.register(_listener.stop)
+
+
+def get_logger(name="detube"):
+    """A logger whose records go through the queue to the JSON writer thread."""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        logger.addHandler(logging.handlers.QueueHandler(_queue))
+        logger.setLevel(LOG_LEVEL)
+        # don't also hand records to the root logger, or they'd get printed twice
+        logger.propagate = False
+    return logger
+
+
+def log_event(logger, event, level=logging.INFO, sample_rate=None, **fields):
+    """Log one event with some fields, e.g. log_event(log, "search", query="cats", results=12).
+
+    Info and debug events are only kept for a random sample_rate share of calls (default LOG_SAMPLE_RATE).
+    """
+    rate = LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+    if level < logging.WARNING and rate < 1 and random.random() >= rate:
+        return
+    if not logger.isEnabledFor(level):
+        return
+    _ensure_listener()
+    logger.log(level, event, extra={"fields": fields})
@@ -0,0 +1,204 @@
+# -------------------------------------------------------------
+# Timing and metrics
+# -------------------------------------------------------------
+# This answers "where does the time go?" for each request. A request is split into
+# named stages (parse, upstream_search, upstream_videos, transform, serialize) and each
+# stage is timed. Those timings go to two places:
+# - the Server-Timing response header, so you can see them per request in the browser's
+#   devtools (Network tab -> Timing)
+# - histograms on the /metrics endpoint, in the plain-text format Prometheus understands,
+#   so you can see the overall picture (and graph it, if you run Prometheus)
+#
+# This is a deliberately small, dependency-free version of what the prometheus_client
+# library does. Every gunicorn worker keeps its own numbers, so /metrics describes
+# whichever worker happened to answer (its pid is included so you can tell them apart).
+# -------------------------------------------------------------
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# histogram bucket edges, in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    # backslashes and quotes inside a label value have to be escaped, like in a JS string
+    inner = ",".join(
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for name, value in labels
+    )
+    return "{" + inner + "}"
+
+
+class Counter:
+    """A number that only goes up, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{_label_text(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """A number that can go up and down (e.g. requests currently in flight)."""
+
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Counts observations into buckets so we can read off percentiles later."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, edge in enumerate(self.buckets):
+                if value <= edge:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, series in self._values.items():
+                for edge, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', edge),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {round(series[-2], 6)}")
+                lines.append(f"{self.name}_count{_label_text(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Holds every metric and turns them into the text /metrics sends back."""
+
+    def __init__(self):
+        self._metrics = []
+        # collectors are functions that return extra (name, kind, help, [(labels, value)]) tuples when
+        # /metrics is read - handy for numbers that already live somewhere else, like the cache counters
+        self._collectors = []
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._add(Gauge(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_label_text(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+# looked up when /metrics is read rather than at import time, since gunicorn may fork after importing us
+registry.add_collector(lambda: [
+    ("detube_worker_info", "gauge", "Always 1, labelled with the pid of the worker that answered", [({"pid": os.getpid()}, 1)])
+])
+
+stage_seconds = registry.histogram("detube_stage_seconds", "Time spent in each stage of a request")
+request_seconds = registry.histogram("detube_request_seconds", "Total time to answer a request")
+requests_in_flight = registry.gauge("detube_requests_in_flight", "Requests currently being answered")
+upstream_responses = registry.counter("detube_upstream_responses_total", "YouTube API responses by endpoint and status")
+
+
+class RequestTimer:
+    """Adds up how long one request spent in each stage."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        # stages can be recorded from several pool threads working on the same request at once
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def server_timing(self):
+        """The value for the Server-Timing header, e.g. 'parse;dur=0.2, upstream_search;dur=131.5'."""
+        with self._lock:
+            parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# the timer for the request this thread is currently answering (None outside a request).
+# a ContextVar is like a global that's separate for every request, even when they run at the same time.
+# thread pools don't carry it over on their own, so work done for a request on another thread has to be
+# submitted through contextvars.copy_context().run (see submit_upstream in app.py).
+current_timer = contextvars.ContextVar("current_timer", default=None)
+
+
+def record_stage(name, seconds):
+    """Record that a stage took `seconds`, in the histogram and in the current request's timer.
+
+    Work with no request behind it (like prefetching) is labelled context="background" in the histogram,
+    so it doesn't get mixed up with the time real requests spend.
+    """
+    timer = current_timer.get()
+    stage_seconds.observe(seconds, stage=name, context="request" if timer is not None else "background")
+    if timer is not None:
+        timer.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time a block of code as one stage: `with stage("upstream_search"): ...`"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
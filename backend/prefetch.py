@@ -0,0 +1,165 @@
+# -------------------------------------------------------------
+# Speculative next-page prefetching
+# -------------------------------------------------------------
+# With infinite scroll, someone who just got page 1 of a search is very likely to ask for
+# page 2 a few seconds later. Instead of making them wait for two YouTube round trips then,
+# we can fetch page 2 in the background right after serving page 1, and keep it in memory
+# until they ask for it.
+#
+# Guesses cost quota, so everything here is bounded:
+# - a small, separate thread pool, so prefetching never holds up real requests
+# - a cap on how many prefetches can be running at once (extra ones are just skipped)
+# - a cap on how much memory the prefetched pages can take up (oldest ones get dropped)
+# - a time limit, after which an unused prefetched page is thrown away
+# and it counts hits (prefetched pages someone asked for) vs wasted ones (never asked for).
+# -------------------------------------------------------------
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """Runs background fetches and holds their results until someone claims them."""
+
+    def __init__(self, workers=2, max_in_flight=4, max_bytes=8 * 1024 * 1024, ttl=300):
+        self.max_in_flight = max_in_flight
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        # key -> (page, size in bytes, stored_at), oldest first
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self._in_flight = set()
+        # key -> job token, for jobs still waiting for a free worker. take() can call those off.
+        self._queued = {}
+        # running keys a request joined (and got its answer from), so they're hits, not pages to keep
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "scheduled": 0, "skipped_busy": 0, "skipped_duplicate": 0, "cancelled": 0,
+            "completed": 0, "failed": 0, "hits": 0, "wasted": 0
+        }
+
+    def schedule(self, key, fetch, on_done=None):
+        """Run fetch() in the background and keep its result under key.
+
+        on_done(result) runs afterwards on the same background thread, e.g. to prefetch the page after.
+        fetch() can return None to say the result wasn't needed after all (e.g. someone else already fetched it).
+        Returns False if it was skipped because too much is already running or key is already handled.
+        """
+        with self._lock:
+            if key in self._in_flight or key in self._pages:
+                self.stats["skipped_duplicate"] += 1
+                return False
+            if len(self._in_flight) >= self.max_in_flight:
+                self.stats["skipped_busy"] += 1
+                return False
+            self._in_flight.add(key)
+            token = self._queued[key] = object()
+            self.stats["scheduled"] += 1
+        self._pool.submit(self._run, key, token, fetch, on_done)
+        return True
+
+    def _run(self, key, token, fetch, on_done):
+        with self._lock:
+            if self._queued.get(key) is not token:
+                # take() called this job off before a worker got to it
+                return
+            del self._queued[key]
+        try:
+            result = fetch()
+        except Exception:
+            # a failed guess doesn't matter much: the real request will just fetch it itself
+            with self._lock:
+                self._in_flight.discard(key)
+                self._claimed.discard(key)
+                self.stats["failed"] += 1
+            return
+        if result is None:
+            with self._lock:
+                self._in_flight.discard(key)
+                self._claimed.discard(key)
+                self.stats["skipped_duplicate"] += 1
+            return
+        self._store(key, result)
+        if on_done is not None:
+            on_done(result)
+
+    def _store(self, key, result):
+        # the size of the page as JSON is a decent estimate of how much memory it takes
+        size = len(json.dumps(result))
+        with self._lock:
+            self._in_flight.discard(key)
+            self.stats["completed"] += 1
+            if key in self._claimed:
+                # already handed to the request that was waiting on it, no need to keep a copy
+                self._claimed.discard(key)
+                self.stats["hits"] += 1
+                return
+            if size > self.max_bytes:
+                self.stats["wasted"] += 1
+                return
+            self._pages[key] = (result, size, time.time())
+            self._bytes += size
+            # over the memory limit? drop the oldest prefetched pages. nobody asked for them, so they were wasted.
+            while self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._pages.popitem(last=False)
+                self._bytes -= old_size
+                self.stats["wasted"] += 1
+
+    def take(self, key):
+        """Hand over the prefetched result for key (and forget it), or None if there isn't a usable one.
+
+        A prefetch for key that's still waiting for a worker is called off, since the caller is
+        about to fetch it anyway. One that's already running is left alone (see claim()).
+        """
+        with self._lock:
+            self._expire(time.time())
+            entry = self._pages.pop(key, None)
+            if entry is None:
+                if self._queued.pop(key, None) is not None:
+                    self._in_flight.discard(key)
+                    self.stats["cancelled"] += 1
+                return None
+            result, size, _ = entry
+            self._bytes -= size
+            self.stats["hits"] += 1
+            return result
+
+    def claim(self, key):
+        """Tell us a request got its answer for key by joining someone else's fetch.
+
+        If that fetch was our prefetch, it counts as a hit (now, or once the prefetch finishes storing).
+        """
+        with self._lock:
+            entry = self._pages.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+                self.stats["hits"] += 1
+            elif key in self._in_flight:
+                self._claimed.add(key)
+
+    def _expire(self, now):
+        # pages are stored oldest first, so we can stop at the first one that's still fresh
+        while self._pages:
+            key, (_, size, stored_at) = next(iter(self._pages.items()))
+            if now - stored_at <= self.ttl:
+                break
+            del self._pages[key]
+            self._bytes -= size
+            self.stats["wasted"] += 1
+
+    def snapshot(self):
+        """Counters ready to be sent back as JSON."""
+        with self._lock:
+            self._expire(time.time())
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._in_flight)
+            stats["stored_pages"] = len(self._pages)
+            stats["stored_bytes"] = self._bytes
+        used = stats["hits"] + stats["wasted"]
+        stats["hit_rate"] = round(stats["hits"] / used, 4) if used else 0.0
+        return stats
@@ -0,0 +1,176 @@
+# -------------------------------------------------------------
+# YouTube quota bookkeeping
+# -------------------------------------------------------------
+# YouTube gives every API key a daily budget of "units" (10,000 by default).
+# A search.list call costs 100 units and a videos.list call costs 1, so searches burn through it fast.
+# This file keeps two limits per API key, and a call has to fit in both:
+# - a hard cap: never more than units_per_key spent in one quota window (a day by default).
+#   Windows roll over at YouTube's own reset time, midnight Pacific (see window_offset_seconds).
+# - a "token bucket" that paces the spending: it holds at most burst_units, every call takes
+#   its cost out, and it refills at units_per_key spread over the window. So a sudden rush of
+#   searches can use up the burst, but not the whole day's quota in one go.
+# If either one doesn't have enough left, we refuse the call ourselves instead of letting
+# YouTube send back an error.
+#
+# A few extras on top:
+# - priorities: "interactive" calls (a person waiting on a search) can use everything,
+#   while "background" calls (prefetching, dashboards) stop once only the reserve is left
+#   (of the bucket and of the window's cap).
+# - key rotation: with several keys configured, each call uses whichever key has the most left.
+# - if YouTube says a key is out of quota anyway, we stop using that key until the window rolls over.
+#
+# Note: every gunicorn worker keeps its own buckets, so split the real quota between them
+# (e.g. 4 workers sharing one 10,000 unit key -> QUOTA_UNITS_PER_KEY=2500).
+# -------------------------------------------------------------
+
+import threading
+import time
+
+# what each kind of call costs, from YouTube's quota calculator
+SEARCH_COST = 100
+VIDEOS_COST = 1
+
+PRIORITIES = ("interactive", "background")
+
+# YouTube resets quotas at midnight Pacific time, which is 08:00 UTC in winter (07:00 in summer).
+# going with the winter time means that in summer we unblock an hour after the real reset, never before it.
+PACIFIC_MIDNIGHT_OFFSET = 8 * 3600
+
+
+class QuotaExhausted(Exception):
+    """Raised when no API key has enough budget left for a call."""
+
+    def __init__(self, retry_after):
+        super().__init__("YouTube API quota exhausted")
+        # roughly how many seconds until some key has refilled enough to try again
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated_at = time.time()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+
+class QuotaAccountant:
+    """Per-window cap plus a pacing token bucket per API key, with priorities and key rotation."""
+
+    def __init__(self, keys, units_per_key=10000, window_seconds=86400, background_reserve=0.2,
+                 burst_units=None, window_offset_seconds=PACIFIC_MIDNIGHT_OFFSET):
+        self.keys = list(keys)
+        self.units_per_key = units_per_key
+        self.window_seconds = window_seconds
+        # where in the day a window starts, in seconds after midnight UTC
+        self.window_offset_seconds = window_offset_seconds
+        # the share of each bucket (and each window's cap) only interactive calls are allowed to dip into
+        self.background_reserve = background_reserve
+        # by default a tenth of the window's units can go out in one burst (but always at least a couple of searches)
+        if burst_units is None:
+            burst_units = min(units_per_key, max(units_per_key // 10, 2 * SEARCH_COST))
+        self.burst_units = burst_units
+        self._buckets = {key: _Bucket(burst_units, units_per_key / window_seconds) for key in self.keys}
+        self._lock = threading.Lock()
+        # units spent per key in the current window, plus a few counters for the /api/quota endpoint
+        self._window_start = self._current_window(time.time())
+        self._spent = {key: 0 for key in self.keys}
+        # keys YouTube has told us are out of quota, blocked until the next window
+        self._exhausted = set()
+        self.stats = {"granted": 0, "denied": 0, "denied_background": 0, "exhausted_by_youtube": 0}
+
+    def _current_window(self, now):
+        return now - ((now - self.window_offset_seconds) % self.window_seconds)
+
+    def _roll_window(self, now):
+        window_start = self._current_window(now)
+        if window_start != self._window_start:
+            self._window_start = window_start
+            self._spent = {key: 0 for key in self.keys}
+            self._exhausted.clear()
+
+    def _reserve(self, capacity, priority):
+        # background calls have to leave the reserve untouched, interactive calls can use everything
+        return capacity * self.background_reserve if priority == "background" else 0
+
+    def _window_left(self, key):
+        if key in self._exhausted:
+            return 0
+        return self.units_per_key - self._spent[key]
+
+    def _affordable(self, key, cost, priority):
+        return (
+            self._window_left(key) - cost >= self._reserve(self.units_per_key, priority)
+            and self._buckets[key].tokens - cost >= self._reserve(self.burst_units, priority)
+        )
+
+    def _seconds_until_affordable(self, key, cost, priority, now):
+        if self._window_left(key) - cost < self._reserve(self.units_per_key, priority):
+            # nothing helps before the window rolls over
+            return self._window_start + self.window_seconds - now
+        bucket = self._buckets[key]
+        missing = self._reserve(self.burst_units, priority) + cost - bucket.tokens
+        return max(0, missing) / bucket.refill_per_second
+
+    def acquire(self, cost, priority="interactive"):
+        """Take cost units from the key with the most budget left and return that key.
+
+        Raises QuotaExhausted if no key can afford the call at this priority.
+        """
+        now = time.time()
+        with self._lock:
+            self._roll_window(now)
+            for bucket in self._buckets.values():
+                bucket.refill(now)
+            affordable = [key for key in self.keys if self._affordable(key, cost, priority)]
+            if not affordable:
+                self.stats["denied"] += 1
+                if priority == "background":
+                    self.stats["denied_background"] += 1
+                wait = min(self._seconds_until_affordable(key, cost, priority, now) for key in self.keys)
+                raise QuotaExhausted(retry_after=int(wait) + 1)
+            key = max(affordable, key=lambda k: min(self._buckets[k].tokens, self._window_left(k)))
+            self._buckets[key].tokens -= cost
+            self._spent[key] += cost
+            self.stats["granted"] += 1
+            return key
+
+    def mark_exhausted(self, key):
+        """YouTube told us this key is out of quota, so stop handing it out until the window rolls over."""
+        with self._lock:
+            if key in self._buckets:
+                self._roll_window(time.time())
+                self._exhausted.add(key)
+                self.stats["exhausted_by_youtube"] += 1
+
+    def snapshot(self):
+        """The current budget state, ready to be sent back as JSON. Keys are shortened so they don't leak."""
+        now = time.time()
+        with self._lock:
+            self._roll_window(now)
+            keys = []
+            for key in self.keys:
+                bucket = self._buckets[key]
+                bucket.refill(now)
+                keys.append({
+                    "key": f"...{key[-4:]}",
+                    "available": int(min(bucket.tokens, self._window_left(key))),
+                    "left_this_window": self._window_left(key),
+                    "capacity": self.units_per_key,
+                    "burst": self.burst_units,
+                    "spent_this_window": self._spent[key],
+                    "exhausted": key in self._exhausted
+                })
+            return {
+                "keys": keys,
+                "window_seconds": self.window_seconds,
+                "window_started_at": int(self._window_start),
+                "window_resets_at": int(self._window_start + self.window_seconds),
+                "background_reserve": self.background_reserve,
+                "costs": {"search": SEARCH_COST, "videos": VIDEOS_COST},
+                **self.stats
+            }
@@ -0,0 +1,109 @@
+# -------------------------------------------------------------
+# Making our JSON responses smaller and cheaper
+# -------------------------------------------------------------
+# Three tricks, all applied automatically to every response once init_app(app) is called:
+# - faster JSON: if the orjson library is installed, jsonify() uses it instead of the
+#   built-in json module (it's several times faster). Without it, Flask's own encoder is used.
+# - ETags: every JSON response gets a fingerprint of its contents in the ETag header.
+#   The browser sends it back in If-None-Match next time, and if nothing changed we answer
+#   "304 Not Modified" with an empty body instead of sending the whole thing again.
+# - compression: big enough responses get squeezed with brotli (if installed) or gzip,
+#   whichever the browser says it accepts. Tiny responses aren't worth it, so
+#   COMPRESS_MIN_BYTES sets the cut-off.
+# -------------------------------------------------------------
+
+import gzip
+import hashlib
+import os
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL_GZIP = 6
+COMPRESS_LEVEL_BROTLI = 5
+# which kinds of response are worth compressing (images are already compressed)
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/css", "text/javascript")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, but using orjson when it's available."""
+
+    # key order is already stable (dicts keep insertion order), so sorting is just wasted work
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype=self.mimetype)
+
+
+def pick_encoding(accept_encoding):
+    """The best compression both we and the browser support, or None."""
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_LEVEL_BROTLI)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL_GZIP)
+
+
+def finish_response(response):
+    """Add an ETag (answering 304 when it matches) and compress the body if it's worth it."""
+    if response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+
+    body = response.get_data()
+    # the answer depends on what the browser accepts, so shared caches must keep the versions apart
+    response.vary.add("Accept-Encoding")
+
+    if request.method == "GET" and response.status_code == 200 and response.mimetype == "application/json":
+        # weak ETag (W/"...") because the same content may go out gzipped, brotli'd or plain
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        response.set_etag(etag, weak=True)
+        if request.if_none_match.contains_weak(etag):
+            response.status_code = 304
+            response.set_data(b"")
+            return response
+
+    encoding = pick_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    with metrics.stage("compress"):
+        compressed = compress(body, encoding)
+    if len(compressed) >= len(body):
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(finish_response)
@@ -0,0 +1,183 @@
+# -------------------------------------------------------------
+# Request coalescing ("single-flight")
+# -------------------------------------------------------------
+# When a search trends, lots of people ask for the exact same thing within the same second.
+# Without this, every one of those requests calls YouTube on its own.
+# With it, the first request (the "leader") makes the upstream call, and every identical
+# request that shows up while it's still running just waits and reuses the leader's answer.
+#
+# Inside one worker process this uses a dict of in-flight calls and threading Events.
+# Across gunicorn workers it can optionally use lock files (a "lease"): the leader in each
+# process grabs an OS file lock for the key, and whoever gets it second re-checks the shared
+# disk cache before calling YouTube. The OS drops the lock automatically if a worker dies,
+# so a crashed worker can't block everyone else. Lock files only work where fcntl exists (Linux/macOS).
+# The file lock is polled (try, sleep a little, try again) rather than waited on, because a blocking
+# flock would freeze a whole gevent worker, including the greenlet that's holding the lock.
+# -------------------------------------------------------------
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# keys are hashed into a fixed number of lock files so the lock folder doesn't grow forever
+LOCK_BUCKETS = 1024
+# how long to wait between attempts while another process holds a lock file
+LEASE_POLL_SECONDS = 0.01
+
+
+class _Call:
+    """One in-flight upstream call that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Make sure only one upstream call per key is running at a time."""
+
+    def __init__(self, name, lock_dir=None):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        # one lock per lock file, so threads in this process queue up here instead of on the file.
+        # (OS file locks belong to each open file, so two threads of the same process would block each other there too)
+        self._bucket_locks = [threading.Lock() for _ in range(LOCK_BUCKETS)]
+        self.stats = {"leader_calls": 0, "shared_in_process": 0, "shared_across_processes": 0}
+
+    def _count(self, field, amount=1):
+        with self._lock:
+            self.stats[field] += amount
+
+    @contextmanager
+    def _process_lease(self, key):
+        # no lock folder configured, so there's nothing to coordinate across processes.
+        # yields whether a lease was actually taken.
+        if not self.lock_dir:
+            yield False
+            return
+        bucket = int(hashlib.sha1(key.encode("utf-8")).hexdigest(), 16) % LOCK_BUCKETS
+        path = os.path.join(self.lock_dir, f"{self.name}-{bucket}.lock")
+        with self._bucket_locks[bucket], open(path, "a") as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # another worker has it. time.sleep lets other threads (or greenlets, under gevent) run meanwhile
+                    time.sleep(LEASE_POLL_SECONDS)
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def do(self, key, fetch, recheck=None):
+        """Return fetch() for this key, sharing the result with identical concurrent calls.
+
+        recheck is an optional function that looks the key up in a shared cache. Only callers that pass
+        one take a cross-process lease: if another worker just fetched the same thing while we waited
+        for the lease, we use its answer instead of calling YouTube again. Without a recheck the lease
+        would only make workers take turns, so it's skipped.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            # someone in this process is already fetching it - wait for them
+            call.done.wait()
+            self._count("shared_in_process")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            lease = self._process_lease(key) if recheck is not None else nullcontext(False)
+            with lease as leased:
+                result = recheck() if leased and recheck is not None else None
+                if result is not None:
+                    self._count("shared_across_processes")
+                else:
+                    result = fetch()
+                    self._count("leader_calls")
+            call.result = result
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do_many(self, keys, fetch):
+        """Like do(), but for a batch of keys fetched together (e.g. video IDs in one videos.list call).
+
+        fetch gets the list of keys nobody else is already fetching and must return a dict of
+        key -> value. Keys another thread is fetching are waited on instead. The return value is
+        a dict with every key that ended up with a value.
+        """
+        mine = {}
+        theirs = {}
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    mine[key] = call
+                else:
+                    theirs[key] = call
+
+        results = {}
+        if mine:
+            try:
+                fetched = fetch(list(mine))
+                for key, call in mine.items():
+                    call.result = fetched.get(key)
+                    if call.result is not None:
+                        results[key] = call.result
+                self._count("leader_calls")
+            except Exception as e:
+                for call in mine.values():
+                    call.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in mine:
+                        del self._calls[key]
+                for call in mine.values():
+                    call.done.set()
+
+        for key, call in theirs.items():
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.result is not None:
+                results[key] = call.result
+        if theirs:
+            self._count("shared_in_process", len(theirs))
+        return results
+
+    def snapshot(self):
+        """Counters ready to be sent back as JSON. "saved" is how many upstream fetches we skipped
+        (for do_many() these count individual keys, i.e. video IDs, rather than calls)."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        stats["saved"] = stats["shared_in_process"] + stats["shared_across_processes"]
+        return stats
@@ -0,0 +1,76 @@
+# -------------------------------------------------------------
+# Tests for the prefetch / single-flight handoff in app.py
+# -------------------------------------------------------------
+# Run with `python -m pytest` from the backend folder. YouTube is never called:
+# fetch_search_page is swapped for a fake that counts how often it runs.
+# -------------------------------------------------------------
+
+import threading
+import time
+
+import pytest
+
+import app
+from prefetch import Prefetcher
+
+
+@pytest.fixture
+def fake_youtube(monkeypatch):
+    """A fresh prefetcher with one worker and a fake fetch_search_page.
+
+    Gives back (calls, release): the calls made so far, and an Event that lets background fetches finish.
+    """
+    calls = []
+    release = threading.Event()
+    monkeypatch.setattr(app, "prefetcher", Prefetcher(workers=1))
+    monkeypatch.setattr(app, "search_cache", app.TieredCache("test-search"))
+
+    def fetch_search_page(query, max_results, order, page_token, video_duration=None, priority="interactive"):
+        calls.append((page_token, priority))
+        if priority == "background":
+            release.wait(5)
+        return {"results": [], "nextPageToken": None}
+
+    monkeypatch.setattr(app, "fetch_search_page", fetch_search_page)
+    yield calls, release
+    release.set()
+    app.prefetcher._pool.shutdown(wait=True)
+
+
+def test_queued_prefetch_is_cancelled_when_the_user_gets_there_first(fake_youtube):
+    calls, _ = fake_youtube
+    # keep the only prefetch worker busy, so the page 1 prefetch stays queued
+    busy = threading.Event()
+    app.prefetcher.schedule("blocker", lambda: busy.wait(5))
+    app.prefetch_next_pages("cats", 12, "relevance", "1", depth=1)
+
+    app.get_search_page("cats", 12, "relevance", "1")
+    busy.set()
+    app.prefetcher._pool.shutdown(wait=True)
+
+    # one search.list call for the page, and the prefetch neither ran nor counted as a hit
+    assert calls == [("1", "interactive")]
+    stats = app.prefetcher.snapshot()
+    assert stats["cancelled"] == 1
+    assert stats["hits"] == 0
+
+
+def test_request_joining_a_running_prefetch_counts_as_a_hit(fake_youtube):
+    calls, release = fake_youtube
+    app.prefetch_next_pages("cats", 12, "relevance", "1", depth=1)
+    # wait until the prefetch is inside YouTube, then ask for the same page
+    while not calls:
+        time.sleep(0.01)
+
+    joiner = threading.Thread(target=app.get_search_page, args=("cats", 12, "relevance", "1"))
+    joiner.start()
+    time.sleep(0.1)
+    release.set()
+    joiner.join(5)
+    app.prefetcher._pool.shutdown(wait=True)
+
+    assert calls == [("1", "background")]
+    stats = app.prefetcher.snapshot()
+    assert stats["hits"] == 1
+    assert stats["wasted"] == 0
+    assert stats["stored_pages"] == 0
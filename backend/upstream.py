@@ -0,0 +1,82 @@
+# -------------------------------------------------------------
+# Shared HTTP client for talking to the YouTube API
+# -------------------------------------------------------------
+# Calling requests.get() directly opens a brand new connection (and TLS handshake)
+# every single time. Instead, each worker process keeps one requests.Session with a
+# connection pool, so calls to googleapis.com reuse warm keep-alive connections.
+# The session also retries a couple of times (with a growing pause in between)
+# when YouTube answers with a 5xx or the connection times out.
+#
+# Everything is configurable with environment variables:
+# - UPSTREAM_POOL_SIZE: how many connections each worker keeps open per host
+# - UPSTREAM_RETRIES: how many times to retry a failed call (0 turns retries off)
+# - UPSTREAM_BACKOFF: base pause between retries in seconds (0.3 -> 0.3s, 0.6s, 1.2s...)
+# - UPSTREAM_CONNECT_TIMEOUT / UPSTREAM_READ_TIMEOUT: seconds to wait to connect / for a response
+#
+# To keep a worker busy while it waits on YouTube, run gunicorn with the gevent worker class
+# (gunicorn -k gevent app:app). gevent swaps the blocking sockets underneath requests for
+# cooperative ones, so the pooled session below doesn't block anything as-is - no separate
+# async code path needed.
+# -------------------------------------------------------------
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", 10))
+RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))
+BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", 0.3))
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 10))
+
+# the status codes worth retrying. 4xx errors (bad key, quota exceeded) won't get better by asking again.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=RETRIES,
+        status=RETRIES,
+        backoff_factor=BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        # hand the last 5xx response back to us instead of raising, so raise_for_status() reports it
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """Return this process's pooled session, creating it on first use."""
+    global _session, _session_pid
+    # gunicorn forks workers from a parent process. Sockets don't survive a fork nicely,
+    # so if we're in a new process we build a fresh session instead of reusing the parent's.
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _build_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def get_json(url, params):
+    """GET a URL through the pooled session and return the parsed JSON body.
+
+    Raises requests.exceptions.RequestException on network errors or error status codes.
+    """
+    response = get_session().get(url, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    response.raise_for_status()
+    return response.json()
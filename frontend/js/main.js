@@ -11,15 +11,31 @@ let currentIndex = 0;   // currently displayed video
 /* ------------------ STATE ------------------ */
 let currentQuery = '';
 let currentSort = 'relevance';
+let currentFilter = ''; // '' (no filter), 'short', 'medium' or 'long' - filtered on the backend
 const pageSize = 12;
 let loading = false;
+let nextPageToken = null; // where the next page starts (from the backend), null when there are no more
+let nextCursor = null;    // same idea, but for filtered searches
+let searchGeneration = 0; // goes up with every new search, so answers that arrive for an older one get thrown away
+let searchController = null; // lets a new search cancel the request that's still loading
 
 /* ------------------ SEARCH ------------------ */
 window.addEventListener('DOMContentLoaded', () => {
     searchInput.focus();
 });
 
+// cancels whatever search request is still loading and makes sure its answer is ignored if it arrives anyway
+function cancelPendingSearch() {
+    if (searchController) searchController.abort();
+    searchController = null;
+    searchGeneration++;
+    loading = false;
+}
+
 function resetSearch() {
+    cancelPendingSearch();
+    nextPageToken = null; // stop infinite scroll from loading more of the old search
+    nextCursor = null;
     resultsDiv.style.transition = 'opacity 0.3s';
     resultsDiv.style.opacity = '0';
     
@@ -68,18 +84,40 @@ async function performSearch(reset = true) {
     if (!currentQuery) return;
 
     if (reset) {
+        // a new search always wins over a "load more" that's still on its way
+        cancelPendingSearch();
         resultsDiv.innerHTML = '<p>Loading...</p>';
+        nextPageToken = null;
+        nextCursor = null;
+    } else if (loading) {
+        return;
+    } else {
+        clearLoadMoreError();
     }
-    if (loading) return;
 
     loading = true;
+    const generation = searchGeneration;
+    const controller = new AbortController();
+    searchController = controller;
 
     try {
+        const filterParam = currentFilter ? `&filter=${currentFilter}` : '';
+        // when loading more (not a fresh search), continue from where the last page stopped
+        let pageParam = '';
+        if (!reset && nextCursor) pageParam = `&cursor=${encodeURIComponent(nextCursor)}`;
+        else if (!reset && nextPageToken) pageParam = `&pageToken=${encodeURIComponent(nextPageToken)}`;
+        // prefetch=1 asks the backend to fetch the following page in the background, so scrolling feels instant
         const res = await fetch(
-            `/api/search?q=${encodeURIComponent(currentQuery)}&maxResults=${pageSize}`
+            `/api/search?q=${encodeURIComponent(currentQuery)}&maxResults=${pageSize}${filterParam}${pageParam}&prefetch=1`,
+            { signal: controller.signal }
         );
         const data = await res.json();
+        // the user started another search while this one was loading - this answer is for the old one
+        if (generation !== searchGeneration) return;
+        if (!res.ok) throw new Error(data.error || res.statusText);
         const newResults = data.results || [];
+        nextPageToken = data.nextPageToken || null;
+        nextCursor = data.nextCursor || null;
 
         if (newResults.length === 0) {
             if (reset) resultsDiv.innerHTML = '<p>No results found.</p>';
@@ -87,15 +125,41 @@ async function performSearch(reset = true) {
         }
 
         renderResults(newResults, reset);
-        currentVideos = newResults;
-        currentIndex = 0;
+        if (reset) {
+            currentVideos = newResults;
+            currentIndex = 0;
+        } else {
+            currentVideos = currentVideos.concat(newResults);
+        }
     } catch (err) {
-        resultsDiv.innerHTML = `<p class="text-danger">Error: ${err.message || err}</p>`;
+        // cancelled because a newer search took over, nothing to show
+        if (generation !== searchGeneration) return;
+        // a failed first page replaces the results, but a failed "load more" keeps what's already there
+        if (reset) resultsDiv.innerHTML = `<p class="text-danger">Error: ${err.message || err}</p>`;
+        else showLoadMoreError(err);
     } finally {
-        loading = false;
+        if (generation === searchGeneration) {
+            loading = false;
+            searchController = null;
+        }
     }
 }
 
+// shown under the results when loading more fails. scrolling down again retries.
+function showLoadMoreError(err) {
+    clearLoadMoreError();
+    const errorEl = document.createElement('p');
+    errorEl.id = 'load-more-error';
+    errorEl.className = 'col-12 text-danger text-center';
+    errorEl.textContent = `Couldn't load more results: ${err.message || err}`;
+    resultsDiv.appendChild(errorEl);
+}
+
+function clearLoadMoreError() {
+    const errorEl = document.getElementById('load-more-error');
+    if (errorEl) errorEl.remove();
+}
+
 /* ------------------ RENDERING ------------------ */
 function renderResults(videos, reset = false) {
  const stickyContainer = document.getElementById('sticky-container');
@@ -239,6 +303,23 @@ searchBtn.addEventListener('click', () => {
     searchInput.blur(); // this closes the mobile keyboard
 
 });
+if (shortsButton) {
+    shortsButton.addEventListener('click', () => {
+        currentFilter = currentFilter === 'short' ? '' : 'short';
+        shortsButton.classList.toggle('active', currentFilter === 'short');
+        if (currentQuery) performSearch(true);
+    });
+}
+
+/* ------------------ INFINITE SCROLL ------------------ */
+// load the next page when the user gets close to the bottom of the results
+window.addEventListener('scroll', () => {
+    if (loading || !(nextPageToken || nextCursor)) return;
+    if (document.querySelector('.video-player-container')) return; // not while watching a video
+
+    const nearBottom = window.innerHeight + window.scrollY >= document.body.offsetHeight - 600;
+    if (nearBottom) performSearch(false);
+});
 
 /* ------------------ HELPERS ------------------ */
 function formatDuration(iso) {